@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Scale benchmark for scheduler.MonitoringScheduler, the loop that drives monitoring.
+
+Fills a temporary SQLite database with N synthetic servers sharing one check
+interval, replaces the prober with a fake of configurable latency and failure
+rate and the bot with a stub that records messages, then runs the scheduler
+(with the periodic history flush) and reports, for a measured window after a
+warm-up: probes per second, check latency from a server's due time to its
+handled result, time spent writing probe results and status changes to SQLite,
+status changes, notifications and peak RSS as JSON.
+
+Each server count runs in its own process, so peak RSS is measured per size:
+
+    python benchmarks/bench_scheduler.py --servers 100 1000 10000 --interval 10 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The SQLite work of the hot path: buffered probe results and queued status changes
+DB_FUNCTIONS = ('add_probe_results', 'flush_status_changes')
+
+
+class FakeBot:
+    """Records sent messages instead of calling the Telegram API."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((time.perf_counter(), chat_id, len(text)))
+
+
+class FakeApp:
+    def __init__(self):
+        self.bot = FakeBot()
+
+
+def make_fake_probe(ping_result, latency_ms: float, jitter_ms: float, failure_rate: float, counter: list):
+    """
+    Returns a stand-in for ping.probe_server with the given latency and failure
+    rate. Every call, confirmation re-probes included, is counted in `counter[0]`.
+    """
+    down = ping_result(status='DOWN', packet_loss=100.0, min_rtt=0, avg_rtt=0, max_rtt=0)
+
+    async def fake_probe(ip_address, probe_type='icmp', port=None, adaptive=False):
+        counter[0] += 1
+        latency = max(0.0, random.gauss(latency_ms, jitter_ms))
+        await asyncio.sleep(latency / 1000)
+        if random.random() < failure_rate:
+            return down
+        return ping_result(status='UP', packet_loss=0.0, min_rtt=latency, avg_rtt=latency, max_rtt=latency)
+
+    return fake_probe
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values, share: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+async def run_size(args) -> dict:
+    import metrics
+    # Enabled before database is imported, so its functions are wrapped by metrics.timed
+    metrics.ENABLED = True
+
+    import database
+    import history
+    import monitoring
+    import notifications
+    import ping
+    import scheduler
+
+    database.initialize_db()
+    for chat_id in range(1, args.admins + 1):
+        database.add_admin(chat_id, 'en' if chat_id % 2 else 'ru')
+    database.add_servers(
+        (f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 'DE', f"bench-{i}", 'icmp', 443, None)
+        for i in range(args.size)
+    )
+    database.set_country_interval('DE', args.interval)
+
+    probes = [0]
+    scheduler.probe_server = make_fake_probe(
+        ping.PingResult, args.latency_ms, args.jitter_ms, args.failure_rate, probes
+    )
+    if args.recheck_delay is not None:
+        monitoring.RECHECK_DELAY = args.recheck_delay
+    if not args.telegram_limits:
+        notifications.GLOBAL_SEND_INTERVAL = notifications.CHAT_SEND_INTERVAL = 0
+
+    latencies = []
+    metrics.check_latency.observe = lambda value, *labels: latencies.append(value)
+
+    def db_totals():
+        totals = {}
+        for name in DB_FUNCTIONS:
+            _, seconds, calls = metrics.db_call._values.get((name,), (None, 0.0, 0))
+            totals[name] = (seconds, calls)
+        return totals
+
+    def status_events():
+        return database.get_connection().execute("SELECT COUNT(*) FROM status_events").fetchone()[0]
+
+    async def flush_periodically():
+        # Stands in for the job queue's history.flush_job
+        while True:
+            await asyncio.sleep(history.FLUSH_INTERVAL)
+            await history.flush()
+
+    app = FakeApp()
+    monitor = scheduler.MonitoringScheduler(app)
+    tasks = [asyncio.create_task(monitor.run()), asyncio.create_task(flush_periodically())]
+    try:
+        # Every server is probed at least once and leaves UNKNOWN before measuring
+        await asyncio.sleep(args.warmup if args.warmup is not None else args.interval)
+        latencies.clear()
+        probes_before, sent_before, events_before, db_before = probes[0], len(app.bot.sent), status_events(), db_totals()
+
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - started
+
+        probed = probes[0] - probes_before
+        sent = app.bot.sent[sent_before:]
+        changes = status_events() - events_before
+        db_after = db_totals()
+        window = list(latencies)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    db = {}
+    for name in DB_FUNCTIONS:
+        seconds = db_after[name][0] - db_before[name][0]
+        db[name] = {'seconds': round(seconds, 4), 'calls': db_after[name][1] - db_before[name][1]}
+    db_seconds = sum(entry['seconds'] for entry in db.values())
+
+    return {
+        'servers': args.size,
+        'interval': args.interval,
+        'duration_seconds': round(elapsed, 2),
+        'admins': args.admins,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'failure_rate': args.failure_rate,
+        'telegram_limits': args.telegram_limits,
+        'probes': probed,
+        'probes_per_second': round(probed / elapsed, 1),
+        'scheduled_probes_per_second': round(args.size / args.interval, 1),
+        'check_latency_ms': {
+            name: round(value * 1000, 1) if value is not None else None
+            for name, value in (
+                ('p50', percentile(window, 0.5)), ('p95', percentile(window, 0.95)),
+                ('p99', percentile(window, 0.99)), ('max', max(window, default=None)),
+            )
+        },
+        'db': db,
+        'db_seconds': round(db_seconds, 4),
+        'db_share': round(db_seconds / elapsed, 4),
+        'status_changes': changes,
+        'notifications': len(sent),
+        'notifications_per_second': round(len(sent) / elapsed, 1),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_single(args):
+    """Runs one server count in this process and prints its result as JSON."""
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['DATABASE_FILE'] = os.path.join(directory, 'bench.db')
+        sys.path.insert(0, REPO_ROOT)
+        import logging
+        logging.basicConfig(level=logging.WARNING)
+        result = asyncio.run(run_size(args))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the monitoring scheduler at scale with a fake prober and bot.")
+    parser.add_argument('--servers', type=int, nargs='+', default=[100, 1000, 10000], help="server counts to run")
+    parser.add_argument('--interval', type=int, default=10, help="check interval of every server, in seconds (default 10)")
+    parser.add_argument('--duration', type=float, default=30.0, help="length of the measured window, in seconds (default 30)")
+    parser.add_argument('--warmup', type=float,
+                        help="time before measuring, in seconds (default one interval, so statuses leave UNKNOWN)")
+    parser.add_argument('--admins', type=int, default=3, help="number of admins to notify (default 3)")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="mean fake probe latency (default 20)")
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help="standard deviation of the latency (default 5)")
+    parser.add_argument('--failure-rate', type=float, default=0.05, help="share of probes that fail (default 0.05)")
+    parser.add_argument('--recheck-delay', type=float,
+                        help="pause between confirmation re-probes, in seconds (default STATUS_RECHECK_DELAY)")
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="keep Telegram send rate limits (off by default to measure the hot path)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)  # Internal: run one size in this process
+    args = parser.parse_args()
+
+    if args.size is not None:
+        run_single(args)
+        return
+
+    runs = []
+    for size in args.servers:
+        command = [
+            sys.executable, os.path.abspath(__file__), '--size', str(size),
+            '--interval', str(args.interval), '--duration', str(args.duration), '--admins', str(args.admins),
+            '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+            '--failure-rate', str(args.failure_rate), '--seed', str(args.seed),
+        ]
+        if args.warmup is not None:
+            command += ['--warmup', str(args.warmup)]
+        if args.recheck_delay is not None:
+            command += ['--recheck-delay', str(args.recheck_delay)]
+        if args.telegram_limits:
+            command.append('--telegram-limits')
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        run = runs[-1]
+        print(f"{size} servers: {run['probes_per_second']} probes/s, "
+              f"p99 check latency {run['check_latency_ms']['p99']} ms, "
+              f"{run['db_seconds']}s in SQLite, {run['peak_rss_mb']} MB peak RSS",
+              file=sys.stderr)
+
+    report = {
+        'benchmark': 'scheduler',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': runs,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,240 @@ Remnawave Subscription to VLESS Keys Converter v0.1
 С поддержкой Subscription Page и разных клиентов
 """
 
-import base64
-import urllib.request
+import argparse
+import asyncio
+import binascii
 import urllib.parse
 import json
-from typing import List, Dict, Optional
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Optional
 import sys
 import re
+import time
+
+import httpx
+
+# Таймаут одного запроса подписки, в секундах
+FETCH_TIMEOUT = 10
+# Сколько запросов вариантов подписки выполняется одновременно через общий пул соединений
+FETCH_MAX_CONNECTIONS = 8
+
+# Сколько запросов выполняется одновременно в пакетном режиме (размер пула соединений)
+BULK_WORKERS = 64
+
+# Сколько подписок хранится в кэше и через сколько секунд запись проверяется условным запросом
+SUBSCRIPTION_CACHE_SIZE = 64
+SUBSCRIPTION_CACHE_TTL = 300
+
+_http_client: Optional[httpx.AsyncClient] = None
+# Очередь запросов к общему клиенту: не больше FETCH_MAX_CONNECTIONS на все конвертации сразу
+_fetch_slots: Optional[asyncio.Semaphore] = None
+
+# Успешный вариант запроса подписки: URL, User-Agent, ключи и валидаторы для условного GET
+CachedSubscription = namedtuple(
+    'CachedSubscription', ['url', 'user_agent', 'keys', 'etag', 'last_modified', 'checked_at']
+)
+
+# URL подписки -> CachedSubscription, в порядке последнего использования (LRU)
+_subscription_cache = OrderedDict()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий асинхронный HTTP-клиент (пул соединений) для получения подписок"""
+    global _http_client, _fetch_slots
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=FETCH_MAX_CONNECTIONS)
+        )
+        _fetch_slots = asyncio.Semaphore(FETCH_MAX_CONNECTIONS)
+    return _http_client
+
+
+async def close_http_client():
+    """Закрывает общий HTTP-клиент"""
+    global _http_client, _fetch_slots
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        _fetch_slots = None
+
+
+# Максимальная длина одного vless:// ключа; более длинные совпадения отбрасываются
+MAX_KEY_LENGTH = 8192
+# JSON нельзя разобрать по частям, поэтому он накапливается целиком, но не больше этого размера
+JSON_MAX_SIZE = 16 * 1024 * 1024
+# Сколько первых значащих байт нужно, чтобы определить формат подписки
+SNIFF_SIZE = 64
+
+_KEY_PREFIX = b'vless://'
+_KEY_PATTERN = re.compile(rb'vless://[^\s<>"\'\)]+')
+_BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+# URL-safe символы переводятся в обычный алфавит, всё остальное (переводы строк и т.п.) удаляется
+_BASE64_TABLE = bytes.maketrans(b'-_', b'+/')
+_BASE64_JUNK = bytes(set(range(256)) - set(_BASE64_ALPHABET) - set(b'-_'))
+
+
+class _KeyScanner:
+    """Находит vless:// ключи в потоке байт, храня только незавершённый хвост"""
+
+    def __init__(self):
+        self._tail = b''
+
+    def feed(self, data: bytes) -> List[str]:
+        buffer = self._tail + data
+        keys = []
+        position = 0
+        for match in _KEY_PATTERN.finditer(buffer):
+            if match.end() == len(buffer):
+                # Ключ может продолжаться в следующем фрагменте
+                tail = buffer[match.start():]
+                self._tail = tail if len(tail) <= MAX_KEY_LENGTH else b''
+                return keys
+            keys.append(match.group().decode('utf-8', errors='ignore'))
+            position = match.end()
+        # Оставляем только то, что может оказаться началом префикса
+        self._tail = buffer[max(position, len(buffer) - len(_KEY_PREFIX)):]
+        return keys
+
+    def close(self) -> List[str]:
+        tail, self._tail = self._tail, b''
+        return [match.group().decode('utf-8', errors='ignore') for match in _KEY_PATTERN.finditer(tail)]
+
+
+class SubscriptionDecoder:
+    """
+    Пошаговый декодер подписки: формат определяется по первым байтам,
+    base64 декодируется по частям, а ключи ищутся потоковым сканером,
+    так что расход памяти не зависит от размера подписки (кроме JSON).
+    Похожий на base64 текст параллельно сканируется как есть: если base64
+    не декодируется или не содержит ключей, используются эти ключи.
+    """
+
+    def __init__(self, converter: 'RemnavaveSubscriptionConverter'):
+        self._converter = converter
+        self._log = converter._log
+        self._mode = None
+        self._head = b''
+        self._pending = b''
+        self._scanner = _KeyScanner()
+        # Сырые байты "base64"-подписки на случай, если это всё-таки текст
+        self._raw_scanner = _KeyScanner()
+        self._raw_keys = []
+        self._decoded_keys = 0
+
+    @property
+    def is_html(self) -> bool:
+        return self._mode == 'html'
+
+    def _sniff(self, data: bytes, final: bool = False) -> Optional[str]:
+        stripped = data.lstrip()
+        if not stripped:
+            return None
+        if stripped[:1] in (b'{', b'['):
+            self._log("📦 Обнаружен JSON формат")
+            return 'json'
+        if stripped[:1] == b'<':
+            return 'html'
+        sample = stripped[:SNIFF_SIZE]
+        if len(sample) < SNIFF_SIZE and not final:
+            return None  # Ждём больше данных
+        if not sample.translate(None, _BASE64_ALPHABET + b'-_ \t\r\n'):
+            self._log("🔓 Подписка в base64, декодирую по частям")
+            return 'base64'
+        self._log("📄 Попытка парсинга как plain text")
+        return 'text'
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Обрабатывает очередной фрагмент ответа и возвращает найденные в нём ключи"""
+        if self._mode is None:
+            self._head += chunk
+            self._mode = self._sniff(self._head)
+            if self._mode is None:
+                return []
+            chunk, self._head = self._head, b''
+
+        if self._mode == 'text':
+            return self._scanner.feed(chunk)
+        if self._mode == 'base64':
+            self._raw_keys += self._raw_scanner.feed(chunk)
+            return self._feed_base64(chunk)
+        if self._mode == 'json':
+            self._pending += chunk
+            if len(self._pending) > JSON_MAX_SIZE:
+                self._log("⚠️ JSON слишком большой, ищу ключи как в plain text")
+                self._mode = 'text'
+                pending, self._pending = self._pending, b''
+                return self._scanner.feed(pending)
+        return []
+
+    def _feed_base64(self, chunk: bytes) -> List[str]:
+        data = self._pending + chunk.translate(_BASE64_TABLE, _BASE64_JUNK)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        try:
+            keys = self._scanner.feed(binascii.a2b_base64(data[:usable]))
+        except binascii.Error as e:
+            self._log(f"⚠️ Ошибка декодирования base64: {e}")
+            return self._fall_back_to_text()
+        self._decoded_keys += len(keys)
+        return keys
+
+    def _fall_back_to_text(self) -> List[str]:
+        self._log("📄 Ищу ключи в подписке как в plain text")
+        self._mode = 'text'
+        self._pending = b''
+        self._scanner = self._raw_scanner
+        keys, self._raw_keys = self._raw_keys, []
+        return keys
+
+    def close(self) -> List[str]:
+        """Завершает разбор и возвращает оставшиеся ключи"""
+        if self._mode is None:
+            self._mode = self._sniff(self._head, final=True) or 'text'
+            head, self._head = self._head, b''
+            keys = self.feed(head)
+        else:
+            keys = []
+
+        if self._mode == 'base64':
+            pending, self._pending = self._pending, b''
+            try:
+                if pending:
+                    keys += self._scanner.feed(binascii.a2b_base64(pending + b'=' * (-len(pending) % 4)))
+                keys += self._scanner.close()
+            except binascii.Error as e:
+                self._log(f"⚠️ Ошибка декодирования base64: {e}")
+            if not keys and not self._decoded_keys:
+                keys = self._fall_back_to_text()
+        elif self._mode == 'json':
+            keys += self._close_json()
+
+        return keys + self._scanner.close()
+
+    def _close_json(self) -> List[str]:
+        pending, self._pending = self._pending, b''
+        try:
+            json_data = json.loads(pending)
+        except ValueError:
+            json_data = None
+
+        vless_keys = []
+        if isinstance(json_data, dict) and ('outbounds' in json_data or 'inbounds' in json_data):
+            self._log("🔧 Парсинг Xray конфигурации...")
+            vless_keys = self._converter.extract_vless_from_xray_config(json_data)
+        elif isinstance(json_data, list):
+            self._log("📋 Парсинг массива конфигураций...")
+            for item in json_data:
+                if isinstance(item, dict):
+                    vless_keys.extend(self._converter.extract_vless_from_xray_config(item))
+
+        if vless_keys:
+            self._log(f"✅ Извлечено {len(vless_keys)} ключей из JSON")
+            return vless_keys
+        # В JSON могут быть просто строки с ключами
+        return self._scanner.feed(pending)
 
 
 class RemnavaveSubscriptionConverter:
@@ -29,96 +256,156 @@ class RemnavaveSubscriptionConverter:
         self.subscription_url = subscription_url
         self.vless_keys = []
         self.verbose = verbose
+        # Вариант запроса (CachedSubscription), который вернул ключи
+        self.source = None
 
     def _log(self, message):
         if self.verbose:
             print(message)
     
-    def fetch_subscription(self, user_agent: str = None) -> tuple[str, bool]:
+    def url_variants(self) -> List[str]:
+        """Варианты URL подписки, которые понимают разные версии Remnawave"""
+        return [
+            self.subscription_url,
+            f"{self.subscription_url}?format=base64",
+            f"{self.subscription_url}?client=v2ray",
+            f"{self.subscription_url}?client=clash",
+        ]
+
+    async def _fetch_variant(self, client: httpx.AsyncClient, url: str, user_agent: str,
+                             cached: CachedSubscription = None) -> Optional[CachedSubscription]:
         """
-        Получение данных подписки с сервера
-        Возвращает (данные, успешно_ли)
+        Запрашивает один вариант подписки. Возвращает запись для кэша, если в ответе
+        есть ключи (или сервер ответил 304 на условный запрос для `cached`), иначе None.
         """
+        headers = {
+            'User-Agent': user_agent,
+            'Accept': '*/*',
+            'Accept-Encoding': 'identity'
+        }
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
         try:
-            # Пробуем разные варианты URL
-            urls_to_try = [
-                self.subscription_url,
-                f"{self.subscription_url}?format=base64",
-                f"{self.subscription_url}?client=v2ray",
-                f"{self.subscription_url}?client=clash",
-            ]
-            
-            if user_agent is None:
-                user_agent = self.CLIENT_USER_AGENTS['v2rayng']
-            
-            for url in urls_to_try:
-                try:
-                    self._log(f"🔄 Пробую: {url}")
-                    self._log(f"   User-Agent: {user_agent}")
-                    
-                    req = urllib.request.Request(
-                        url,
-                        headers={
-                            'User-Agent': user_agent,
-                            'Accept': '*/*',
-                            'Accept-Encoding': 'identity'
-                        }
-                    )
-                    
-                    with urllib.request.urlopen(req, timeout=10) as response:
-                        raw_data = response.read()
-                        content_type = response.headers.get('Content-Type', '')
-                        
-                        # Проверяем, не HTML ли это
-                        decoded = raw_data.decode('utf-8', errors='ignore')
-                        
-                        if 'text/html' in content_type or decoded.strip().startswith('<!DOCTYPE') or decoded.strip().startswith('<html'):
-                            self._log(f"   ⚠️ Получен HTML, пробую следующий вариант...")
-                            continue
-                        
-                        self._log(f"✅ Успешно получены данные ({len(raw_data)} байт)")
-                        return decoded, True
-                    
-                except urllib.error.HTTPError as e:
-                    self._log(f"   ❌ HTTP {e.code}: {e.reason}")
-                    continue
-                except Exception as e:
-                    self._log(f"   ❌ Ошибка: {e}")
-                    continue
-            
-            return "", False
-            
-        except Exception as e:
-            self._log(f"❌ Критическая ошибка при получении подписки: {e}")
-            return "", False
-    
-    def try_all_clients(self) -> bool:
-        """Пробует получить подписку с разными User-Agent клиентов"""
-        self._log(f"\n🔍 Пробую разные VPN клиенты...\n")
-        
-        for client_name, user_agent in self.CLIENT_USER_AGENTS.items():
-            self._log(f"{ '='*70}")
-            self._log(f"🎯 Клиент: {client_name}")
-            self._log(f"{ '='*70}")
-            
-            raw_data, success = self.fetch_subscription(user_agent)
-            
-            if success and raw_data:
-                self.vless_keys = self.decode_subscription(raw_data)
-                
-                if self.vless_keys:
-                    self._log(f"\n🎉 Успех! Найдено {len(self.vless_keys)} ключей с клиентом {client_name}")
-                    return True
-        
-        return False
-    
-    def try_parse_json(self, data: str) -> Optional[Dict]:
-        """Попытка распарсить JSON"""
+            async with client.stream('GET', url, headers=headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    self._log("✅ Подписка не изменилась (304)")
+                    return cached._replace(checked_at=time.monotonic())
+
+                if response.status_code >= 400:
+                    self._log(f"   ❌ HTTP {response.status_code} ({url}, {user_agent}): {response.reason_phrase}")
+                    return None
+
+                if 'text/html' in response.headers.get('Content-Type', ''):
+                    self._log(f"   ⚠️ Получен HTML ({url}, {user_agent})")
+                    return None
+
+                decoder = SubscriptionDecoder(self)
+                vless_keys = []
+                async for chunk in response.aiter_bytes():
+                    vless_keys.extend(decoder.feed(chunk))
+                    if decoder.is_html:
+                        self._log(f"   ⚠️ Получен HTML ({url}, {user_agent})")
+                        return None
+                vless_keys.extend(decoder.close())
+        except httpx.HTTPError as e:
+            self._log(f"   ❌ Ошибка ({url}, {user_agent}): {e!r}")
+            return None
+
+        if not vless_keys:
+            return None
+        return CachedSubscription(
+            url=url,
+            user_agent=user_agent,
+            keys=tuple(vless_keys),
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            checked_at=time.monotonic()
+        )
+
+    async def _race_variants(self, client: httpx.AsyncClient,
+                             request_slots: asyncio.Semaphore) -> Optional[CachedSubscription]:
+        # Одна подписка занимает не больше FETCH_MAX_CONNECTIONS общих слотов,
+        # чтобы её варианты не вытесняли остальные конвертации
+        own_slots = asyncio.Semaphore(FETCH_MAX_CONNECTIONS)
+
+        async def fetch(url, user_agent):
+            # Очередь держим сами: пул httpx плохо справляется с большим числом ожидающих запросов
+            async with own_slots, request_slots:
+                return await self._fetch_variant(client, url, user_agent)
+
+        tasks = [
+            asyncio.create_task(fetch(url, user_agent))
+            for user_agent in self.CLIENT_USER_AGENTS.values()
+            for url in self.url_variants()
+        ]
         try:
-            return json.loads(data)
-        except:
+            for next_finished in asyncio.as_completed(tasks):
+                result = await next_finished
+                if result is not None:
+                    return result
             return None
-    
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def convert_and_get_keys_async(self, client: httpx.AsyncClient = None,
+                                         request_slots: asyncio.Semaphore = None) -> List[str]:
+        """
+        Получает подписку и возвращает список ключей: все варианты User-Agent и URL
+        запрашиваются одновременно, первый ответ с ключами побеждает,
+        остальные запросы отменяются.
+        Успешный вариант кэшируется: в течение SUBSCRIPTION_CACHE_TTL ключи
+        возвращаются без запросов, затем проверяются одним условным GET.
+        `request_slots` ограничивает число одновременных запросов через `client`
+        и должен соответствовать размеру его пула. Для общего клиента по
+        умолчанию используется общая очередь на FETCH_MAX_CONNECTIONS запросов.
+        """
+        if client is None:
+            client = get_http_client()
+            request_slots = _fetch_slots
+        request_slots = request_slots or asyncio.Semaphore(FETCH_MAX_CONNECTIONS)
+        result = None
+
+        cached = _subscription_cache.get(self.subscription_url)
+        if cached is not None:
+            _subscription_cache.move_to_end(self.subscription_url)
+            if time.monotonic() - cached.checked_at < SUBSCRIPTION_CACHE_TTL:
+                self._log(f"📦 Ключи взяты из кэша ({len(cached.keys)})")
+                result = cached
+            else:
+                async with request_slots:
+                    result = await self._fetch_variant(client, cached.url, cached.user_agent, cached)
+
+        if result is None:
+            result = await self._race_variants(client, request_slots)
+
+        if result is None:
+            _subscription_cache.pop(self.subscription_url, None)
+            return []
+
+        _subscription_cache[self.subscription_url] = result
+        _subscription_cache.move_to_end(self.subscription_url)
+        while len(_subscription_cache) > SUBSCRIPTION_CACHE_SIZE:
+            _subscription_cache.popitem(last=False)
+
+        self._log(f"\n🎉 Успех! Найдено {len(result.keys)} ключей")
+        self.source = result
+        self.vless_keys = list(result.keys)
+        return self.vless_keys
+
+    def client_name(self) -> Optional[str]:
+        """Имя клиента, User-Agent которого сработал при последней конвертации"""
+        if self.source is None:
+            return None
+        for client_name, user_agent in self.CLIENT_USER_AGENTS.items():
+            if user_agent == self.source.user_agent:
+                return client_name
+        return None
+
     def extract_vless_from_xray_config(self, config: Dict) -> List[str]:
         """Извлечение vless ключей из Xray конфига"""
         vless_keys = []
@@ -200,72 +487,204 @@ class RemnavaveSubscriptionConverter:
         vless_url = f"vless://{uuid}@{address}:{port}?{params_str}#{urllib.parse.quote(name)}"
         
         return vless_url
-    
-    def extract_vless_from_text(self, text: str) -> List[str]:
-        """Извлечение vless:// ключей из текста"""
-        pattern = r'vless://[^\s\n<>"\'\)]+'
-        matches = re.findall(pattern, text)
-        return matches
-    
-    def decode_subscription(self, raw_data: str) -> List[str]:
-        """Декодирование подписки с поддержкой множества форматов"""
-        vless_keys = []
-        
-        # 1. JSON конфиг
-        json_data = self.try_parse_json(raw_data)
-        
-        if json_data:
-            self._log("📦 Обнаружен JSON формат")
-            
-            if 'outbounds' in json_data or 'inbounds' in json_data:
-                self._log("🔧 Парсинг Xray конфигурации...")
-                vless_keys = self.extract_vless_from_xray_config(json_data)
-            
-            elif isinstance(json_data, list):
-                self._log("📋 Парсинг массива конфигураций...")
-                for item in json_data:
-                    if isinstance(item, dict):
-                        keys = self.extract_vless_from_xray_config(item)
-                        vless_keys.extend(keys)
-            
-            if vless_keys:
-                self._log(f"✅ Извлечено {len(vless_keys)} ключей из JSON")
-                return vless_keys
-        
-        # 2. Base64
+
+
+# Разобранный vless:// ключ; params - кортеж пар (имя, значение) в исходном порядке
+VlessKey = namedtuple('VlessKey', ['uuid', 'host', 'port', 'name', 'params', 'url'])
+
+_VLESS_URL_PATTERN = re.compile(
+    r'vless://(?P<uuid>[^@/?#\s]+)@(?:\[(?P<ipv6>[0-9A-Fa-f:.]+)\]|(?P<host>[^:/?#\s\[\]]+))'
+    r'(?::(?P<port>\d{1,5}))?/?(?:\?(?P<query>[^#\s]*))?(?:#(?P<name>\S*))?'
+)
+
+
+def parse_vless_key(vless_url: str) -> Optional[VlessKey]:
+    """Строгий разбор vless:// ключа за один проход. Возвращает None, если ключ некорректен"""
+    match = _VLESS_URL_PATTERN.fullmatch(vless_url.strip())
+    if not match:
+        return None
+
+    port = int(match['port'] or 443)
+    if not 0 < port < 65536:
+        return None
+
+    params = []
+    if match['query']:
+        for param in match['query'].split('&'):
+            key, separator, value = param.partition('=')
+            if separator:
+                params.append((key, urllib.parse.unquote(value)))
+
+    return VlessKey(
+        uuid=match['uuid'],
+        host=match['ipv6'] or match['host'],
+        port=port,
+        name=urllib.parse.unquote(match['name'] or ''),
+        params=tuple(params),
+        url=match.group()
+    )
+
+
+def key_identity(key: VlessKey) -> tuple:
+    """Ключи с одинаковыми uuid, сервером, портом и параметрами считаются одним ключом"""
+    return key.uuid, key.host.lower(), key.port, tuple(sorted(key.params))
+
+
+def parse_many(vless_urls: Iterable[str]) -> List[VlessKey]:
+    """Разбирает ключи пачкой, пропуская некорректные и дубликаты (имя ключа не учитывается)"""
+    keys = {}
+    for vless_url in vless_urls:
+        key = parse_vless_key(vless_url)
+        if key is not None:
+            keys.setdefault(key_identity(key), key)
+    return list(keys.values())
+
+
+async def bulk_convert(urls: Iterable[str], workers: int = BULK_WORKERS, output=sys.stdout) -> Dict:
+    """
+    Конвертирует много подписок одновременно через один HTTP-клиент с общим
+    пулом на `workers` соединений и пишет по одной JSON-строке на подписку по мере готовности.
+    Время `elapsed` включает ожидание свободного соединения.
+    Ключи, уже встреченные в предыдущих подписках, не повторяются.
+    Возвращает сводку: число подписок, успешных, уникальных ключей и общее время.
+    """
+    started = time.perf_counter()
+    seen_keys = set()
+    converted = 0
+
+    client = httpx.AsyncClient(
+        timeout=FETCH_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=workers)
+    )
+    # Запросы ждут своей очереди здесь, а не в пуле httpx, который плохо справляется с длинной очередью
+    request_slots = asyncio.Semaphore(workers)
+
+    async def convert(url):
+        url_started = time.perf_counter()
+        converter = RemnavaveSubscriptionConverter(url)
+        error = None
         try:
-            decoded = base64.b64decode(raw_data).decode('utf-8')
-            self._log("🔓 Подписка декодирована из base64")
-            vless_keys = self.extract_vless_from_text(decoded)
+            vless_keys = await converter.convert_and_get_keys_async(client, request_slots)
+        except Exception as e:
+            vless_keys = []
+            error = str(e)
+        return url, converter, vless_keys, time.perf_counter() - url_started, error
+
+    tasks = [asyncio.create_task(convert(url)) for url in dict.fromkeys(urls)]
+    try:
+        for next_finished in asyncio.as_completed(tasks):
+            url, converter, vless_keys, elapsed, error = await next_finished
+            keys = parse_many(vless_keys)
+            new_keys = []
+            for key in keys:
+                identity = key_identity(key)
+                if identity not in seen_keys:
+                    seen_keys.add(identity)
+                    new_keys.append(key.url)
+            if keys:
+                converted += 1
+
+            record = {
+                'url': url,
+                'ok': bool(keys),
+                'client': converter.client_name(),
+                'variant': converter.source.url if converter.source else None,
+                'elapsed': round(elapsed, 3),
+                'keys': new_keys,
+                'duplicates': len(keys) - len(new_keys),
+            }
+            if error:
+                record['error'] = error
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        await client.aclose()
+
+    return {
+        'subscriptions': len(tasks),
+        'converted': converted,
+        'unique_keys': len(seen_keys),
+        'elapsed': round(time.perf_counter() - started, 3),
+    }
+
+
+def print_key_info(key: VlessKey, index: int):
+    print(f"\n{ '='*70}")
+    print(f"🔑 Ключ #{index + 1}: {key.name or 'Без названия'}")
+    print(f"{ '='*70}")
+    print(f"UUID:      {key.uuid}")
+    print(f"Сервер:    {key.host}")
+    print(f"Порт:      {key.port}")
+    print(f"\nПараметры:")
+    for name, value in key.params:
+        print(f"  {name:15} = {value}")
+
+
+def key_details(key: VlessKey) -> Dict:
+    return {
+        'uuid': key.uuid,
+        'host': key.host,
+        'port': key.port,
+        'name': key.name,
+        'params': dict(key.params)
+    }
+
+
+def save_to_file(filename: str, keys: List[VlessKey]):
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("# Remnawave VLESS Keys\n")
+            f.write(f"# Total: {len(keys)} keys\n\n")
             
-            if vless_keys:
-                self._log(f"✅ Найдено {len(vless_keys)} ключей в base64")
-                return vless_keys
-        except:
-            pass
-        
-        # 3. Plain text
-        self._log("📄 Попытка парсинга как plain text")
-        vless_keys = self.extract_vless_from_text(raw_data)
+            for i, key in enumerate(keys, 1):
+                f.write(f"# Key {i}\n")
+                f.write(f"{key.url}\n\n")
+            
+            f.write("\n\n# Detailed JSON Format:\n")
+            f.write(json.dumps([key_details(key) for key in keys], indent=2, ensure_ascii=False))
         
-        if vless_keys:
-            self._log(f"✅ Найдено {len(vless_keys)} ключей в plain text")
-            return vless_keys
+        print(f"💾 Ключи сохранены в файл: {filename}")
         
-        return []
-    
-    def convert_and_get_keys(self):
-        """
-        Запускает процесс конвертации и возвращает список ключей.
-        Не выводит ничего в консоль.
-        """
-        success = self.try_all_clients()
-        if success and self.vless_keys:
-            return self.vless_keys
-        return []
+    except OSError as e:
+        print(f"❌ Ошибка при сохранении файла: {e}")
+
+
+def _read_urls(source: str) -> List[str]:
+    stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+async def _convert_once(converter: RemnavaveSubscriptionConverter) -> List[str]:
+    try:
+        return await converter.convert_and_get_keys_async()
+    finally:
+        await close_http_client()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Remnawave Subscription → VLESS Keys Converter")
+    parser.add_argument('url', nargs='?', help="URL подписки (без него URL будет запрошен)")
+    parser.add_argument('--bulk', metavar='FILE',
+                        help="пакетный режим: файл со списком URL (по одному в строке, '-' - stdin), "
+                             "результаты выводятся в stdout в формате JSONL")
+    parser.add_argument('--workers', type=int, default=BULK_WORKERS,
+                        help=f"сколько запросов выполнять одновременно (по умолчанию {BULK_WORKERS})")
+    args = parser.parse_args()
+
+    if args.bulk:
+        summary = asyncio.run(bulk_convert(_read_urls(args.bulk), max(1, args.workers)))
+        print(
+            f"✅ Подписок: {summary['subscriptions']}, успешно: {summary['converted']}, "
+            f"уникальных ключей: {summary['unique_keys']}, время: {summary['elapsed']} с",
+            file=sys.stderr
+        )
+        return
+
     print("""
 ╔═══════════════════════════════════════════════════════════╗
 ║   Remnawave Subscription → VLESS Keys Converter v0.1     ║
@@ -273,8 +692,8 @@ def main():
 ╚═══════════════════════════════════════════════════════════╝
     """)
     
-    if len(sys.argv) > 1:
-        subscription_url = sys.argv[1]
+    if args.url:
+        subscription_url = args.url
     else:
         subscription_url = input("🔗 Введите URL подписки Remnawave: ").strip()
     
@@ -287,8 +706,7 @@ def main():
     
     save_file = input("\n💾 Сохранить ключи в файл? (Enter - пропустить, или укажите имя файла): ").strip()
     
-    # Для CLI используем старый метод, который всё печатает
-    converter.vless_keys = converter.convert_and_get_keys()
+    converter.vless_keys = asyncio.run(_convert_once(converter))
     
     if not converter.vless_keys:
         print("\n❌ Не удалось получить vless ключи")
@@ -303,92 +721,20 @@ def main():
     print("📋 РЕЗУЛЬТАТЫ КОНВЕРТАЦИИ")
     print(f"{ '='*70}")
 
-    parsed_keys_list = []
-    for i, key in enumerate(converter.vless_keys):
-        parsed = converter.parse_vless_key(key)
-        if parsed:
-            parsed_keys_list.append(parsed)
-            converter.print_key_info(parsed, i)
+    keys = parse_many(converter.vless_keys)
+    for i, key in enumerate(keys):
+        print_key_info(key, i)
 
     if save_file:
-        converter.save_to_file(save_file, parsed_keys_list)
+        save_to_file(save_file, keys)
 
     print(f"\n{ '='*70}")
     print("🔑 ВСЕ КЛЮЧИ (для копирования):")
     print(f"{ '='*70}\n")
-    for i, key in enumerate(converter.vless_keys, 1):
-        print(f"{i}. {key}\n")
+    for i, key in enumerate(keys, 1):
+        print(f"{i}. {key.url}\n")
         
     print("\n✅ Готово!")
 
 if __name__ == "__main__":
     main()
-
-# Functions for parsing a vless key, not used in main conversion logic but useful for details
-def parse_vless_key(vless_url: str) -> Dict:
-    if not vless_url.startswith('vless://'):
-        return None
-    
-    url_without_prefix = vless_url[8:]
-    parts = url_without_prefix.split('?')
-    
-    user_and_server = parts[0]
-    uuid, server_info = user_and_server.split('@')
-    
-    if ':' in server_info:
-        host, port = server_info.rsplit(':', 1)
-    else:
-        host = server_info
-        port = '443'
-    
-    params = {}
-    name = ""
-    
-    if len(parts) > 1:
-        param_and_name = parts[1].split('#')
-        param_string = param_and_name[0]
-        
-        if len(param_and_name) > 1:
-            name = urllib.parse.unquote(param_and_name[1])
-        
-        for param in param_string.split('&'):
-            if '=' in param:
-                key, value = param.split('=', 1)
-                params[key] = urllib.parse.unquote(value)
-    
-    return {
-        'uuid': uuid,
-        'host': host,
-        'port': port,
-        'name': name,
-        'params': params
-    }
-
-def print_key_info(parsed: Dict, index: int):
-    print(f"\n{ '='*70}")
-    print(f"🔑 Ключ #{index + 1}: {parsed['name'] or 'Без названия'}")
-    print(f"{ '='*70}")
-    print(f"UUID:      {parsed['uuid']}")
-    print(f"Сервер:    {parsed['host']}")
-    print(f"Порт:      {parsed['port']}")
-    print(f"\nПараметры:")
-    for key, value in parsed['params'].items():
-        print(f"  {key:15} = {value}")
-        
-def save_to_file(filename: str, vless_keys: List[str], parsed_keys: List[Dict]):
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write("# Remnawave VLESS Keys\n")
-            f.write(f"# Total: {len(vless_keys)} keys\n\n")
-            
-            for i, key in enumerate(vless_keys, 1):
-                f.write(f"# Key {i}\n")
-                f.write(f"{key}\n\n")
-            
-            f.write("\n\n# Detailed JSON Format:\n")
-            f.write(json.dumps(parsed_keys, indent=2, ensure_ascii=False))
-        
-        print(f"💾 Ключи сохранены в файл: {filename}")
-        
-    except Exception as e:
-        print(f"❌ Ошибка при сохранении файла: {e}")
@@ -1,4 +1,6 @@
 import logging
+import re
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +85,9 @@ COUNTRIES_DB = [
     {"code": "VN", "en": "Vietnam", "ru": "Вьетнам"},
 ]
 
+# User-assigned ISO 3166 code for servers whose country could not be recognized
+UNKNOWN_COUNTRY_CODE = 'XX'
+
 # Regional Indicator Symbols for creating flag emojis
 REGIONAL_INDICATORS = {
     'A': '🇦', 'B': '🇧', 'C': '🇨', 'D': '🇩', 'E': '🇪', 'F': '🇫', 'G': '🇬', 'H': '🇭', 'I': '🇮',
@@ -90,9 +95,10 @@ REGIONAL_INDICATORS = {
     'S': '🇸', 'T': '🇹', 'U': '🇺', 'V': '🇻', 'W': '🇼', 'X': '🇽', 'Y': '🇾', 'Z': '🇿'
 }
 
+@lru_cache(maxsize=None)
 def get_flag_emoji(country_code):
     """Converts a two-letter country code to its flag emoji."""
-    if not country_code or len(country_code) != 2:
+    if not country_code or len(country_code) != 2 or country_code == UNKNOWN_COUNTRY_CODE:
         return '🏳️'
     char1, char2 = country_code[0].upper(), country_code[1].upper()
     if char1 in REGIONAL_INDICATORS and char2 in REGIONAL_INDICATORS:
@@ -121,8 +127,45 @@ def get_country_name_by_code(code, lang='ru'):
     """Retrieves a country name by its code."""
     country = get_country_by_code(code)
     if not country:
-        return 'Неизвестная страна'
+        return 'Неизвестная страна' if lang == 'ru' else 'Unknown country'
     
     if lang == 'ru':
         return country["ru"]
     return country["en"]
+
+# Country-code TLDs that are mostly used as generic domains and say nothing about the location
+GENERIC_TLDS = {'AI', 'CC', 'CO', 'FM', 'GG', 'IO', 'LY', 'ME', 'SH', 'TK', 'TO', 'TV', 'WS'}
+
+_FLAG_PATTERN = re.compile('[\U0001F1E6-\U0001F1FF]{2}')
+_COUNTRY_CODES = {country["code"] for country in COUNTRIES_DB}
+_COUNTRY_NAME_PATTERN = re.compile(
+    r'\b(' + '|'.join(sorted(
+        (re.escape(country[lang]) for country in COUNTRIES_DB for lang in ('en', 'ru')),
+        key=len, reverse=True
+    )) + r')\b',
+    re.IGNORECASE
+)
+_CODES_BY_NAME = {country[lang].lower(): country["code"] for country in COUNTRIES_DB for lang in ('en', 'ru')}
+
+def infer_country_code(name: str, host: str = ''):
+    """
+    Guesses a server's country from a key or server name (a flag emoji or a
+    country name in English or Russian), or else from the host's country-code TLD.
+    Returns None if nothing matches.
+    """
+    flag = _FLAG_PATTERN.search(name or '')
+    if flag:
+        code = ''.join(chr(ord(char) - 0x1F1E6 + ord('A')) for char in flag.group())
+        if code in _COUNTRY_CODES:
+            return code
+
+    match = _COUNTRY_NAME_PATTERN.search(name or '')
+    if match:
+        return _CODES_BY_NAME[match.group().lower()]
+
+    tld = host.rstrip('.').rsplit('.', 1)[-1].upper() if '.' in host else ''
+    if tld == 'UK':
+        tld = 'GB'
+    if tld in _COUNTRY_CODES and tld not in GENERIC_TLDS:
+        return tld
+    return None
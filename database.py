@@ -1,12 +1,54 @@
+import hashlib
 import sqlite3
 import os
 import logging
+import threading
+import time
+from collections import namedtuple
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 DATABASE_FILE = os.getenv('DATABASE_FILE', 'monitoring_bot.db')
+# Admin sessions expire this many seconds after login (0 keeps them until /logout)
+SESSION_TTL = int(os.getenv('SESSION_TTL', 0))
 logger = logging.getLogger(__name__)
 
+# Probe history rollups: (resolution, bucket size in seconds, source resolution or None for raw samples)
+ROLLUPS = [
+    ('1m', 60, None),
+    ('1h', 3600, '1m'),
+    ('1d', 86400, '1h'),
+]
+
+# How long samples are kept, in seconds, per resolution ('raw' is the probe_history table)
+HISTORY_RETENTION = {
+    'raw': 2 * 86400,
+    '1m': 7 * 86400,
+    '1h': 90 * 86400,
+    '1d': 730 * 86400,
+}
+
+_local = threading.local()
+
+def get_connection():
+    """
+    Returns this thread's long-lived connection, opening it on first use.
+    Used as a context manager it commits or rolls back, but stays open. The
+    database runs in WAL mode, so readers in other threads (handlers and
+    asyncio.to_thread workers each get their own connection) never block the writer.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_FILE, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _local.conn = conn
+    return conn
+
 def add_column_if_not_exists(db_file, table_name, column_name, column_type, default_value=None):
     """Safely adds a new column to a table if it doesn't already exist."""
     with sqlite3.connect(db_file) as conn:
@@ -26,7 +68,7 @@ def add_column_if_not_exists(db_file, table_name, column_name, column_type, defa
 
 def initialize_db():
     """Initializes the database and creates tables with the new schema."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS servers (
@@ -35,81 +77,258 @@ def initialize_db():
                 country_code TEXT NOT NULL,
                 name TEXT NOT NULL,
                 last_status TEXT DEFAULT 'UNKNOWN',
-                status_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                status_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                probe_type TEXT DEFAULT 'icmp',
+                probe_port INTEGER DEFAULT 443,
+                check_interval INTEGER,
+                resolved_ip TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS probe_history (
+                server_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                packet_loss REAL,
+                min_rtt REAL,
+                avg_rtt REAL,
+                max_rtt REAL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_servers_country_code ON servers (country_code)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_probe_history_ts ON probe_history (ts)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS probe_rollups (
+                server_id INTEGER NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket_ts INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                up_samples INTEGER NOT NULL,
+                avg_loss REAL,
+                min_rtt REAL,
+                avg_rtt REAL,
+                max_rtt REAL,
+                PRIMARY KEY (server_id, resolution, bucket_ts)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_probe_rollups_bucket ON probe_rollups (resolution, bucket_ts)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS status_events (
+                server_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                old_status TEXT,
+                new_status TEXT NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_status_events_server ON status_events (server_id, ts)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dns_events (
+                server_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                old_ip TEXT,
+                new_ip TEXT NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_dns_events_server ON dns_events (server_id, ts)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                resolution TEXT PRIMARY KEY,
+                rolled_until INTEGER NOT NULL
             )
         ''')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS admins (
                 chat_id INTEGER PRIMARY KEY,
-                language TEXT DEFAULT 'ru'
+                language TEXT DEFAULT 'ru',
+                session_started INTEGER
             )
         ''')
         conn.commit()
     # Perform maintenance on startup
     add_column_if_not_exists(DATABASE_FILE, 'admins', 'language', 'TEXT', default_value='ru')
+    add_column_if_not_exists(DATABASE_FILE, 'admins', 'session_started', 'INTEGER')
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'probe_type', 'TEXT', default_value='icmp')
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'probe_port', 'INTEGER', default_value=443)
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'check_interval', 'INTEGER')
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'resolved_ip', 'TEXT')
+    _registry()
 
 
 # --- Admin Management Functions ---
+# Admin sessions are cached in memory as {chat_id: (language, session_started)}, so
+# resolving a user's admin flag and language never touches SQLite. Every write below
+# updates the database and the cache together; expired sessions are only dropped
+# from the cache and deleted later by remove_expired_admins.
+_admin_sessions = None
+_expired_sessions = []  # (chat_id, session_started) pairs waiting to be deleted
+_admin_lock = threading.RLock()
+
+def _sessions():
+    global _admin_sessions
+    with _admin_lock:
+        if _admin_sessions is None:
+            now = int(time.time())
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                # Sessions from before session_started existed count from their first load
+                cursor.execute("UPDATE admins SET session_started = ? WHERE session_started IS NULL", (now,))
+                cursor.execute("SELECT chat_id, language, session_started FROM admins")
+                rows = cursor.fetchall()
+                conn.commit()
+            _admin_sessions = {chat_id: (language, started) for chat_id, language, started in rows}
+
+        if SESSION_TTL:
+            now = time.time()
+            expired = [
+                (chat_id, started) for chat_id, (_, started) in _admin_sessions.items()
+                if now - started > SESSION_TTL
+            ]
+            for chat_id, started in expired:
+                logger.info(f"DATABASE: Admin session of {chat_id} expired.")
+                del _admin_sessions[chat_id]
+            _expired_sessions.extend(expired)
+        return _admin_sessions
+
+@metrics.timed(metrics.db_call)
 def add_admin(chat_id, language='ru'):
-    """Adds a new admin session with a default language."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
+    """
+    Starts an admin session, or restarts it if the admin logs in again.
+    A returning admin keeps their language; new admins get `language`.
+    """
+    started = int(time.time())
+    with _admin_lock:
+        sessions = _sessions()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO admins (chat_id, language, session_started) VALUES (?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET session_started = excluded.session_started
+                """,
+                (chat_id, language, started)
+            )
+            cursor.execute("SELECT language FROM admins WHERE chat_id = ?", (chat_id,))
+            language = cursor.fetchone()[0]
+            conn.commit()
+        sessions[chat_id] = (language, started)
+
+@metrics.timed(metrics.db_call)
+def remove_expired_admins():
+    """Deletes expired sessions from the database, unless the admin has logged in again since."""
+    with _admin_lock:
+        _sessions()  # Drops sessions that expired since the cache was last read
+        if not _expired_sessions:
+            return 0
+        batch = _expired_sessions[:]
+        _expired_sessions.clear()
+
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO admins (chat_id, language) VALUES (?, ?)", (chat_id, language))
+        cursor.executemany("DELETE FROM admins WHERE chat_id = ? AND session_started = ?", batch)
         conn.commit()
+    return len(batch)
 
+@metrics.timed(metrics.db_call)
 def remove_admin(chat_id):
     """Removes an admin session."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM admins WHERE chat_id = ?", (chat_id,))
-        conn.commit()
+    with _admin_lock:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM admins WHERE chat_id = ?", (chat_id,))
+            conn.commit()
+        if _admin_sessions is not None:
+            _admin_sessions.pop(chat_id, None)
 
 def get_admins():
     """Returns a list of (chat_id, language) tuples for all active admins."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT chat_id, language FROM admins")
-        return cursor.fetchall()
+    with _admin_lock:
+        return [(chat_id, language) for chat_id, (language, _) in _sessions().items()]
 
 def get_admin_language(chat_id):
     """Gets the language for a specific admin."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT language FROM admins WHERE chat_id = ?", (chat_id,))
-        result = cursor.fetchone()
-        return result[0] if result else 'ru'
+    session = _sessions().get(chat_id)
+    return session[0] if session else 'ru'
 
+@metrics.timed(metrics.db_call)
 def set_admin_language(chat_id, language):
     """Sets the language for a specific admin."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE admins SET language = ? WHERE chat_id = ?", (language, chat_id))
-        conn.commit()
+    with _admin_lock:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE admins SET language = ? WHERE chat_id = ?", (language, chat_id))
+            conn.commit()
+        sessions = _sessions()
+        if chat_id in sessions:
+            sessions[chat_id] = (language, sessions[chat_id][1])
 
 def get_admin_count():
     """Counts the number of active admin sessions."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM admins")
-        return cursor.fetchone()[0]
+    return len(_sessions())
 
 def is_admin(chat_id):
     """Checks if a user is a logged-in admin."""
-    admin_ids = [admin[0] for admin in get_admins()]
-    return chat_id in admin_ids
+    return chat_id in _sessions()
 # --- End Admin Management Functions ---
 
-def add_server(ip_address, country_code, name):
-    """Adds a server to the database with its custom name."""
+# --- Server Registry ---
+# All servers are kept in memory, keyed by IP and indexed by country and by server_key(). The registry is
+# loaded once and every server write below goes to the database and to the registry.
+Server = namedtuple(
+    'Server', ['ip_address', 'name', 'last_status', 'country_code', 'probe_type', 'probe_port', 'check_interval']
+)
+_servers = None
+_servers_by_country = {}
+_servers_by_key = {}  # server_key() -> ip_address
+_registry_lock = threading.RLock()
+
+def _registry():
+    global _servers
+    if _servers is None:
+        with _registry_lock:
+            if _servers is None:
+                with get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        "SELECT ip_address, name, last_status, country_code, probe_type, probe_port, check_interval "
+                        "FROM servers ORDER BY id"
+                    )
+                    rows = [Server(*row) for row in cursor.fetchall()]
+                _servers_by_country.clear()
+                _servers_by_key.clear()
+                for server in rows:
+                    _servers_by_country.setdefault(server.country_code, set()).add(server.ip_address)
+                    _servers_by_key[server_key(server.ip_address)] = server.ip_address
+                _servers = {server.ip_address: server for server in rows}
+                logger.info(f"DATABASE: Loaded {len(rows)} servers into the registry.")
+    return _servers
+
+def _update_registry(ip_address, **changes):
+    with _registry_lock:
+        server = _registry().get(ip_address)
+        if server is not None:
+            _servers[ip_address] = server._replace(**changes)
+
+@metrics.timed(metrics.db_call)
+def add_server(ip_address, country_code, name, resolved_ip=None):
+    """Adds a server to the database with its custom name and, for a hostname, the IP it resolved to."""
     logger.info(f"DATABASE: Attempting to add server. IP: {ip_address}, Country: {country_code}, Name: {name}")
-    with sqlite3.connect(DATABASE_FILE) as conn:
+    with _registry_lock, get_connection() as conn:
         cursor = conn.cursor()
         try:
             cursor.execute(
-                "INSERT INTO servers (ip_address, country_code, name) VALUES (?, ?, ?)",
-                (ip_address, country_code, name)
+                "INSERT INTO servers (ip_address, country_code, name, resolved_ip) VALUES (?, ?, ?, ?)",
+                (ip_address, country_code, name, resolved_ip)
+            )
+            cursor.execute(
+                "SELECT ip_address, name, last_status, country_code, probe_type, probe_port, check_interval "
+                "FROM servers WHERE ip_address = ?",
+                (ip_address,)
             )
+            server = Server(*cursor.fetchone())
             conn.commit()
+            _registry()[ip_address] = server
+            _servers_by_country.setdefault(country_code, set()).add(ip_address)
+            _servers_by_key[server_key(ip_address)] = ip_address
             logger.info("DATABASE: Add server successful.")
             return True
         except sqlite3.IntegrityError:
@@ -119,52 +338,292 @@ def add_server(ip_address, country_code, name):
             logger.error(f"DATABASE: An unexpected error occurred in add_server: {e}")
             return False
 
+@metrics.timed(metrics.db_call)
+def add_servers(servers):
+    """
+    Adds many servers in one transaction. `servers` holds
+    (ip_address, country_code, name, probe_type, probe_port, resolved_ip) tuples,
+    where resolved_ip is what a hostname resolved to (None for an IP);
+    IPs that are already monitored are skipped. Returns the added servers.
+    """
+    with _registry_lock, get_connection() as conn:
+        registry = _registry()
+        new_servers, resolved_ips = {}, {}
+        for ip_address, country_code, name, probe_type, probe_port, resolved_ip in servers:
+            if ip_address not in registry and ip_address not in new_servers:
+                new_servers[ip_address] = Server(ip_address, name, 'UNKNOWN', country_code, probe_type, probe_port, None)
+                resolved_ips[ip_address] = resolved_ip
+        if not new_servers:
+            return []
+
+        try:
+            conn.executemany(
+                "INSERT INTO servers (ip_address, country_code, name, probe_type, probe_port, resolved_ip) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (s.ip_address, s.country_code, s.name, s.probe_type, s.probe_port, resolved_ips[s.ip_address])
+                    for s in new_servers.values()
+                ]
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"DATABASE: Failed to add {len(new_servers)} servers: {e}")
+            return []
+
+        for server in new_servers.values():
+            registry[server.ip_address] = server
+            _servers_by_country.setdefault(server.country_code, set()).add(server.ip_address)
+            _servers_by_key[server_key(server.ip_address)] = server.ip_address
+        logger.info(f"DATABASE: Added {len(new_servers)} servers in one transaction.")
+        return list(new_servers.values())
+
 def count_servers_by_country(country_code: str) -> int:
     """Counts how many servers are already registered for a given country."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM servers WHERE country_code = ?", (country_code,))
-        count = cursor.fetchone()[0]
-        logger.info(f"DATABASE: Found {count} servers with country_code {country_code}.")
-        return count
+    _registry()
+    return len(_servers_by_country.get(country_code, ()))
 
 def get_all_servers():
-    """Fetches all servers, including their custom name."""
-    logger.info("DATABASE: Getting all servers.")
-    with sqlite3.connect(DATABASE_FILE) as conn:
+    """Returns all servers, including their custom name, probe settings and check interval."""
+    with _registry_lock:
+        return list(_registry().values())
+
+def get_servers_by_country(country_code: str):
+    """Returns all servers registered for a given country."""
+    with _registry_lock:
+        servers = _registry()
+        return [servers[ip] for ip in _servers_by_country.get(country_code, ())]
+
+def server_key(ip_address: str) -> str:
+    """
+    Short key of a server for inline keyboard callback data, which Telegram
+    limits to 64 bytes; a hostname alone can be longer than that.
+    """
+    return hashlib.sha1(ip_address.encode()).hexdigest()[:16]
+
+def get_server_by_key(key: str):
+    """Returns the server whose server_key() is `key`, or None if it is no longer monitored."""
+    with _registry_lock:
+        servers = _registry()
+        ip_address = _servers_by_key.get(key)
+        return servers.get(ip_address) if ip_address is not None else None
+
+@metrics.timed(metrics.db_call)
+def remove_server(ip_address):
+    with _registry_lock, get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT ip_address, name, last_status, country_code FROM servers")
-        servers = cursor.fetchall()
-        logger.info(f"DATABASE: Found {len(servers)} servers: {servers}")
-        return servers
-
-def get_server_details(ip_address: str):
-    """Fetches details for a specific server, including its custom name."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
+        cursor.execute("SELECT id FROM servers WHERE ip_address = ?", (ip_address,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        cursor.execute("DELETE FROM probe_history WHERE server_id = ?", (row[0],))
+        cursor.execute("DELETE FROM probe_rollups WHERE server_id = ?", (row[0],))
+        cursor.execute("DELETE FROM status_events WHERE server_id = ?", (row[0],))
+        cursor.execute("DELETE FROM dns_events WHERE server_id = ?", (row[0],))
+        cursor.execute("DELETE FROM servers WHERE id = ?", (row[0],))
+        conn.commit()
+
+        server = _registry().pop(ip_address, None)
+        if server is not None:
+            _servers_by_country.get(server.country_code, set()).discard(ip_address)
+            _servers_by_key.pop(server_key(ip_address), None)
+        return True
+
+@metrics.timed(metrics.db_call)
+def update_resolved_ip(address, resolved_ip, previous_ip=None):
+    """
+    Stores the IP a server's hostname resolved to and records a DNS event if it
+    differs from the stored one, or from `previous_ip` when none is stored yet.
+    Returns the previous IP, or None.
+    """
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT ip_address, name, last_status, country_code FROM servers WHERE ip_address = ?", (ip_address,))
-        return cursor.fetchone()
+        cursor.execute("SELECT id, resolved_ip FROM servers WHERE ip_address = ?", (address,))
+        row = cursor.fetchone()
+        if not row or row[1] == resolved_ip:
+            return row[1] if row else None
+        server_id, previous_ip = row[0], row[1] or previous_ip
+        cursor.execute("UPDATE servers SET resolved_ip = ? WHERE id = ?", (resolved_ip, server_id))
+        if previous_ip is not None and previous_ip != resolved_ip:
+            cursor.execute(
+                "INSERT INTO dns_events (server_id, ts, old_ip, new_ip) VALUES (?, ?, ?, ?)",
+                (server_id, int(time.time()), previous_ip, resolved_ip)
+            )
+        conn.commit()
+        return previous_ip
 
-def remove_server(ip_address):
-    with sqlite3.connect(DATABASE_FILE) as conn:
+_status_changes = []
+
+def queue_server_status(ip_address, old_status, new_status):
+    """
+    Updates a server's status in the registry right away and buffers the database
+    write, so a burst of status changes is stored by one flush_status_changes call.
+    """
+    with _registry_lock:
+        _update_registry(ip_address, last_status=new_status)
+        _status_changes.append((ip_address, int(time.time()), old_status, new_status))
+
+@metrics.timed(metrics.db_call)
+def flush_status_changes():
+    """
+    Writes buffered status changes, and a status event for each, in a single transaction.
+    If the write fails, the changes are put back in front of the buffer for the next flush.
+    """
+    with _registry_lock:
+        if not _status_changes:
+            return 0
+        batch = _status_changes[:]
+        _status_changes.clear()
+
+    try:
+        _write_status_changes(batch)
+    except Exception:
+        with _registry_lock:
+            _status_changes[:0] = batch
+        raise
+    return len(batch)
+
+def _write_status_changes(batch):
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM servers WHERE ip_address = ?", (ip_address,))
+        cursor.executemany(
+            "UPDATE servers SET last_status = ?, status_timestamp = datetime(?, 'unixepoch') WHERE ip_address = ?",
+            [(new_status, ts, ip) for ip, ts, _, new_status in batch]
+        )
+        cursor.executemany(
+            """
+            INSERT INTO status_events (server_id, ts, old_status, new_status)
+            SELECT id, ?, ?, ? FROM servers WHERE ip_address = ?
+            """,
+            [(ts, old_status, new_status, ip) for ip, ts, old_status, new_status in batch]
+        )
         conn.commit()
-        return cursor.rowcount > 0
 
-def update_server_status(ip_address, status):
-    """Updates the status of a server."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
+@metrics.timed(metrics.db_call)
+def set_server_probe(ip_address, probe_type, probe_port):
+    """Sets how a server is probed: 'icmp', 'tcp' or 'tls', and the port for the latter two."""
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "UPDATE servers SET last_status = ?, status_timestamp = CURRENT_TIMESTAMP WHERE ip_address = ?",
-            (status, ip_address)
+            "UPDATE servers SET probe_type = ?, probe_port = ? WHERE ip_address = ?",
+            (probe_type, probe_port, ip_address)
         )
         conn.commit()
+    _update_registry(ip_address, probe_type=probe_type, probe_port=probe_port)
+    return cursor.rowcount > 0
+
+@metrics.timed(metrics.db_call)
+def set_server_interval(ip_address, interval):
+    """Sets a server's own check interval in seconds. None falls back to the global interval."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE servers SET check_interval = ? WHERE ip_address = ?", (interval, ip_address))
+        conn.commit()
+    _update_registry(ip_address, check_interval=interval)
+    return cursor.rowcount > 0
+
+@metrics.timed(metrics.db_call)
+def set_country_interval(country_code, interval):
+    """Sets the check interval of every server in a country. Returns the number of servers updated."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE servers SET check_interval = ? WHERE country_code = ?", (interval, country_code))
+        conn.commit()
+    for server in get_servers_by_country(country_code):
+        _update_registry(server.ip_address, check_interval=interval)
+    return cursor.rowcount
+# --- End Server Registry ---
+
+# --- Probe History Functions ---
+@metrics.timed(metrics.db_call)
+def add_probe_results(results):
+    """
+    Stores a batch of probe results in a single transaction.
+    `results` is a list of (ip_address, ts, status, packet_loss, min_rtt, avg_rtt, max_rtt) tuples.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO probe_history (server_id, ts, status, packet_loss, min_rtt, avg_rtt, max_rtt)
+            SELECT id, ?, ?, ?, ?, ?, ? FROM servers WHERE ip_address = ?
+            """,
+            [(ts, status, loss, min_rtt, avg_rtt, max_rtt, ip) for ip, ts, status, loss, min_rtt, avg_rtt, max_rtt in results]
+        )
+        conn.commit()
+
+@metrics.timed(metrics.db_call)
+def rollup_probe_history(now, grace=30):
+    """
+    Aggregates completed buckets into the 1m, 1h and 1d rollups, each built from the
+    previous resolution. Buckets are only rolled up once they are older than `grace`
+    seconds, so samples still waiting in a write buffer are not missed.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for resolution, size, source in ROLLUPS:
+            cursor.execute("SELECT rolled_until FROM rollup_state WHERE resolution = ?", (resolution,))
+            row = cursor.fetchone()
+            since = row[0] if row else 0
+            until = (now - grace) // size * size
+            if until <= since:
+                continue
+
+            if source is None:
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO probe_rollups
+                        (server_id, resolution, bucket_ts, samples, up_samples, avg_loss, min_rtt, avg_rtt, max_rtt)
+                    SELECT server_id, ?, ts - ts % ?, COUNT(*), SUM(status = 'UP'), AVG(packet_loss),
+                           MIN(CASE WHEN status = 'UP' THEN min_rtt END),
+                           AVG(CASE WHEN status = 'UP' THEN avg_rtt END),
+                           MAX(CASE WHEN status = 'UP' THEN max_rtt END)
+                    FROM probe_history WHERE ts >= ? AND ts < ?
+                    GROUP BY server_id, ts - ts % ?
+                    """,
+                    (resolution, size, since, until, size)
+                )
+            else:
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO probe_rollups
+                        (server_id, resolution, bucket_ts, samples, up_samples, avg_loss, min_rtt, avg_rtt, max_rtt)
+                    SELECT server_id, ?, bucket_ts - bucket_ts % ?, SUM(samples), SUM(up_samples),
+                           SUM(avg_loss * samples) / SUM(samples), MIN(min_rtt),
+                           SUM(avg_rtt * up_samples) / NULLIF(SUM(up_samples), 0), MAX(max_rtt)
+                    FROM probe_rollups WHERE resolution = ? AND bucket_ts >= ? AND bucket_ts < ?
+                    GROUP BY server_id, bucket_ts - bucket_ts % ?
+                    """,
+                    (resolution, size, source, since, until, size)
+                )
+            cursor.execute("INSERT OR REPLACE INTO rollup_state (resolution, rolled_until) VALUES (?, ?)", (resolution, until))
+        conn.commit()
+
+@metrics.timed(metrics.db_call)
+def prune_probe_history(now):
+    """Deletes raw samples and rollups that are older than their retention period."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM probe_history WHERE ts < ?", (now - HISTORY_RETENTION['raw'],))
+        pruned = cursor.rowcount
+        for resolution, _, _ in ROLLUPS:
+            cursor.execute(
+                "DELETE FROM probe_rollups WHERE resolution = ? AND bucket_ts < ?",
+                (resolution, now - HISTORY_RETENTION[resolution])
+            )
+            pruned += cursor.rowcount
+        conn.commit()
+        return pruned
+# --- End Probe History Functions ---
 
 if __name__ == '__main__':
     print("Performing database maintenance...")
     initialize_db()
     add_column_if_not_exists(DATABASE_FILE, 'servers', 'name', 'TEXT')
     add_column_if_not_exists(DATABASE_FILE, 'admins', 'language', 'TEXT', default_value='ru')
+    add_column_if_not_exists(DATABASE_FILE, 'admins', 'session_started', 'INTEGER')
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'probe_type', 'TEXT', default_value='icmp')
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'probe_port', 'INTEGER', default_value=443)
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'check_interval', 'INTEGER')
+    add_column_if_not_exists(DATABASE_FILE, 'servers', 'resolved_ip', 'TEXT')
     print("Database maintenance complete.")
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import time
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# How often buffered probe results are written, and rollups/retention are applied (seconds)
+FLUSH_INTERVAL = 10
+ROLLUP_INTERVAL = 60
+
+_buffer = []
+
+def record(ip_address: str, ping_result):
+    """Buffers a probe result; it is written with the next batch."""
+    _buffer.append((
+        ip_address, int(time.time()), ping_result.status, ping_result.packet_loss,
+        ping_result.min_rtt, ping_result.avg_rtt, ping_result.max_rtt
+    ))
+
+def _write(batch):
+    if batch:
+        db.add_probe_results(batch)
+    changes = db.flush_status_changes()
+    if changes:
+        logger.info(f"History: Stored {changes} status changes.")
+
+async def flush():
+    """Writes buffered probe results and status changes, one transaction each."""
+    global _buffer
+    batch, _buffer = _buffer, []
+    try:
+        await asyncio.to_thread(_write, batch)
+    except Exception as e:
+        logger.error(f"Failed to store {len(batch)} probe results: {e}")
+
+async def flush_job(context):
+    """Job queue callback writing buffered probe results."""
+    await flush()
+
+async def rollup_job(context):
+    """Job queue callback building history rollups and pruning expired samples."""
+    now = int(time.time())
+    try:
+        await asyncio.to_thread(db.rollup_probe_history, now, 3 * FLUSH_INTERVAL)
+        pruned = await asyncio.to_thread(db.prune_probe_history, now)
+        if pruned:
+            logger.info(f"History: Pruned {pruned} expired samples.")
+    except Exception as e:
+        logger.error(f"History maintenance failed: {e}")
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+PAYLOAD = bytes(range(56))  # Same payload size as the system ping
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024  # Room for a burst of replies from a large batch
+
+def _checksum(data: bytes) -> int:
+    """Computes the RFC 1071 internet checksum."""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def _build_echo_request(ident: int, seq: int) -> bytes:
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + PAYLOAD)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + PAYLOAD
+
+
+class IcmpSocket:
+    """
+    A single non-blocking ICMP socket shared by all probes on an event loop.
+    Echo replies are matched back to their waiting coroutine by (ip, seq).
+    Uses an unprivileged datagram socket when the kernel allows it
+    (net.ipv4.ping_group_range) and falls back to a raw socket otherwise.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._sock, self._raw = self._open_socket()
+        # The kernel rewrites the id of datagram sockets, so it is only checked for raw ones
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = 0
+        self._pending = {}
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+        logger.info(f"ICMP: Using {'raw' if self._raw else 'datagram'} socket for probes.")
+
+    @staticmethod
+    def _open_socket():
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            raw = False
+        except OSError:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            raw = True
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        except OSError:
+            pass  # The kernel default is still usable for small fleets
+        return sock, raw
+
+    def _next_seq(self, ip_address: str) -> int:
+        while True:
+            self._seq = (self._seq + 1) & 0xFFFF
+            if (ip_address, self._seq) not in self._pending:
+                return self._seq
+
+    def send_echo(self, ip_address: str, timeout: float) -> asyncio.Future:
+        """
+        Sends one echo request without waiting for the reply.
+        The returned future resolves to the RTT in milliseconds, or None on loss.
+        """
+        seq = self._next_seq(ip_address)
+        future = self._loop.create_future()
+        try:
+            self._sock.sendto(_build_echo_request(self._ident, seq), (ip_address, 0))
+        except OSError as e:
+            logger.debug(f"ICMP: Failed to send echo to {ip_address}: {e}")
+            future.set_result(None)
+            return future
+
+        key = (ip_address, seq)
+        self._pending[key] = (future, time.perf_counter())
+        timer = self._loop.call_later(timeout, self._expire, key)
+        future.add_done_callback(lambda _: self._forget(key, timer))
+        return future
+
+    def _forget(self, key, timer):
+        # Also covers futures cancelled by the caller before a reply or timeout
+        timer.cancel()
+        self._pending.pop(key, None)
+
+    def _expire(self, key):
+        entry = self._pending.pop(key, None)
+        if entry is not None and not entry[0].done():
+            entry[0].set_result(None)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, (ip_address, _) = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"ICMP: Receive error: {e}")
+                return
+            received_at = time.perf_counter()
+
+            if self._raw:
+                # Raw sockets deliver the IP header as well
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+
+            icmp_type, _, _, ident, seq = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (self._raw and ident != self._ident):
+                continue
+
+            entry = self._pending.pop((ip_address, seq), None)
+            if entry is not None and not entry[0].done():
+                future, sent_at = entry
+                future.set_result((received_at - sent_at) * 1000)
+
+    def close(self):
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+
+
+_shared_socket: Optional[IcmpSocket] = None
+_unavailable = False
+
+def get_icmp_socket() -> Optional[IcmpSocket]:
+    """
+    Returns the ICMP socket shared by the running event loop,
+    or None if neither datagram nor raw ICMP sockets are permitted.
+    """
+    global _shared_socket, _unavailable
+    if _unavailable:
+        return None
+
+    loop = asyncio.get_running_loop()
+    if _shared_socket is not None and _shared_socket._loop is loop:
+        return _shared_socket
+
+    try:
+        _shared_socket = IcmpSocket(loop)
+    except OSError as e:
+        logger.warning(f"ICMP: Sockets are not available ({e}), falling back to the system ping.")
+        _unavailable = True
+        return None
+    return _shared_socket
@@ -1,4 +1,6 @@
 # localization.py
+import string
+
 import database as db
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -27,6 +29,12 @@ translations = {
         'interval_slow': "Slow (15 minutes)",
         'interval_updated': "✅ *Check interval updated to {interval} seconds.*",
         'interval_update_error': "❌ *An error occurred while changing the interval.*",
+        'server_interval_no_servers': "*No servers to configure.*",
+        'server_interval_target_prompt': "⏱ *Individual intervals*\n\nDefault interval: *{interval} seconds*.\n\nSelect a country or a server:",
+        'server_interval_country_button': "All servers in {country}",
+        'server_interval_value_prompt': "Select the check interval for `{target}`:",
+        'server_interval_default': "Default",
+        'server_interval_updated': "✅ Interval for `{target}` set to *{interval}* ({count} servers).",
 
         # Converter
         'convert_prompt': "Please send me the VLESS subscription link you want to convert.",
@@ -36,14 +44,21 @@ translations = {
         'convert_success': "✅ *Successfully found {count} keys!*",
         'convert_too_large': "Keys are in the text file as there are too many of them.",
         'convert_error': "An internal error occurred during conversion. Please try again later.",
+        'convert_import_prompt': "📥 Add the {count} servers from these keys to monitoring?",
+        'convert_import_button': "📥 Add to monitoring",
+        'convert_import_skip_button': "Skip",
+        'convert_import_skipped': "Servers were not added.",
+        'convert_import_resolving': "⏳ Resolving {count} hosts...",
+        'convert_import_result': "✅ *Added {added} servers* (checked by TCP connect on the key's port).\nOf them, country not recognized (listed as \"Unknown country\"): {unknown}\n\nAlready monitored: {existing}\nHost not resolved: {unresolved}\n\nServers whose host was not resolved can be added with /addserver.",
 
         # Add Server
         'add_server_country_prompt': "Enter the name of the country where the server is located (e.g., 'Germany' or 'Finland').",
         'add_server_country_not_found': "😕 Country not found for query '{query}'. Please try again.",
         'add_server_country_too_many': "Too many matches found. Please specify your query.",
         'add_server_country_clarify': "Several matches found. Please choose one of the options:",
-        'add_server_ip_prompt': "Selected country: {flag} *{country_name}*\n\nNow enter the server's IP address:",
-        'add_server_invalid_ip': "❌ *Invalid IP address format.*\nPlease enter a valid IPv4 address.",
+        'add_server_ip_prompt': "Selected country: {flag} *{country_name}*\n\nNow enter the server's IP address or hostname:",
+        'add_server_invalid_ip': "❌ *Invalid address format.*\nPlease enter a valid IPv4 address or hostname.",
+        'add_server_unresolved': "❌ The hostname `{host}` does not resolve. Check it and try again.",
         'add_server_success': "✅ Server '{name}' (`{ip}`) added successfully!",
         'add_server_already_exists': "⚠️ A server with the IP `{ip}` is already being monitored.",
 
@@ -52,12 +67,24 @@ translations = {
         'remove_server_prompt': "*Select a server to remove:*",
         'remove_server_success': "✅ Server `{ip}` has been removed.",
         'remove_server_not_found': "⚠️ Could not find server `{ip}`. It might have been already removed.",
+        'server_gone': "⚠️ This server is no longer monitored. It might have been removed.",
 
         # Check Server
         'check_server_no_servers': "*No servers to check.*",
         'check_server_prompt': "*Select a server for an instant check:*",
         'check_server_checking': "*Checking* `{ip}`...",
 
+        # Probe Type
+        'probe_no_servers': "*No servers to configure.*",
+        'probe_server_prompt': "*Select a server to change its probe type:*",
+        'probe_type_prompt': "How should `{ip}` be checked?",
+        'probe_type_icmp': "ICMP (ping)",
+        'probe_type_tcp': "TCP connect",
+        'probe_type_tls': "TLS handshake",
+        'probe_port_prompt': "Enter the port to probe (e.g. `{port}`):",
+        'probe_invalid_port': "❌ *Invalid port.*\nPlease enter a number from 1 to 65535.",
+        'probe_updated': "✅ Server `{ip}` will now be checked with *{probe}*.",
+
         # List Servers
         'list_servers_no_servers': "*There are currently no monitored servers.*",
         'list_servers_title': "📋 *Monitored servers:*\n\n",
@@ -75,6 +102,9 @@ translations = {
         'monitoring_new_status': "New status: *{status_text}*",
         'monitoring_server_name': "{flag} *{name}*",
         'monitoring_server_ip': "Server: `{ip}`",
+        'monitoring_digest_title': "🚨 *{count} servers changed status* 🚨",
+        'monitoring_digest_group': "{emoji} *{status_text}* ({count}):",
+        'monitoring_digest_line': "{flag} *{name}* (`{ip}`)",
 
         # Ping Report
         'ping_report_title': "📊 *Check result for* {flag} *{name}* (`{ip}`)",
@@ -86,6 +116,9 @@ translations = {
         'ping_rtt_max': "   - Max: `{ms:.3f} ms`",
         'ping_packet_loss': "📉 *Packet loss:* `{loss}%`",
         'ping_offline_reason': "Reason: Server does not respond to ICMP (ping) requests.",
+        'ping_offline_reason_dns': "Reason: The hostname does not resolve.",
+        'ping_offline_reason_tcp': "Reason: Server does not accept TCP connections on port {port}.",
+        'ping_offline_reason_tls': "Reason: Server does not complete a TLS handshake on port {port}.",
         'ping_error': "An error occurred while checking `{ip}`.",
     },
     'ru': {
@@ -108,6 +141,12 @@ translations = {
         'interval_slow': "Медленная (15 минут)",
         'interval_updated': "✅ *Интервал проверки обновлен до {interval} секунд.*",
         'interval_update_error': "❌ *Произошла ошибка при смене интервала.*",
+        'server_interval_no_servers': "*Нет серверов для настройки.*",
+        'server_interval_target_prompt': "⏱ *Индивидуальные интервалы*\n\nИнтервал по умолчанию: *{interval} секунд*.\n\nВыберите страну или сервер:",
+        'server_interval_country_button': "Все серверы: {country}",
+        'server_interval_value_prompt': "Выберите интервал проверки для `{target}`:",
+        'server_interval_default': "По умолчанию",
+        'server_interval_updated': "✅ Интервал для `{target}` установлен: *{interval}* (серверов: {count}).",
         
         # Converter
         'convert_prompt': "Пожалуйста, отправьте мне ссылку на подписку VLESS, которую вы хотите конвертировать.",
@@ -117,14 +156,21 @@ translations = {
         'convert_success': "✅ *Успешно найдено {count} ключей!*",
         'convert_too_large': "Ключи в текстовом файле, так как их слишком много.",
         'convert_error': "Произошла внутренняя ошибка при конвертации. Пожалуйста, попробуйте позже.",
+        'convert_import_prompt': "📥 Добавить {count} серверов из этих ключей в мониторинг?",
+        'convert_import_button': "📥 Добавить в мониторинг",
+        'convert_import_skip_button': "Пропустить",
+        'convert_import_skipped': "Серверы не добавлены.",
+        'convert_import_resolving': "⏳ Определяю адреса {count} хостов...",
+        'convert_import_result': "✅ *Добавлено серверов: {added}* (проверка TCP-подключением к порту ключа).\nИз них страна не определена (в списке как «Неизвестная страна»): {unknown}\n\nУже отслеживаются: {existing}\nАдрес не найден: {unresolved}\n\nСерверы с ненайденным адресом можно добавить через /addserver.",
         
         # Add Server
         'add_server_country_prompt': "Введите название страны, в которой находится сервер (например, 'Германия' или 'Finland').",
         'add_server_country_not_found': "😕 Страна по запросу '{query}' не найдена. Попробуйте еще раз.",
         'add_server_country_too_many': "Найдено слишком много совпадений. Пожалуйста, уточните ваш запрос.",
         'add_server_country_clarify': "Найдено несколько совпадений. Пожалуйста, выберите один из вариантов:",
-        'add_server_ip_prompt': "Выбрана страна: {flag} *{country_name}*\n\nТеперь введите IP-адрес сервера:",
-        'add_server_invalid_ip': "❌ *Неверный формат IP-адреса.*\nПожалуйста, введите действительный IPv4-адрес.",
+        'add_server_ip_prompt': "Выбрана страна: {flag} *{country_name}*\n\nТеперь введите IP-адрес или имя хоста сервера:",
+        'add_server_invalid_ip': "❌ *Неверный формат адреса.*\nПожалуйста, введите действительный IPv4-адрес или имя хоста.",
+        'add_server_unresolved': "❌ Имя хоста `{host}` не удаётся разрешить. Проверьте его и попробуйте снова.",
         'add_server_success': "✅ Сервер '{name}' (`{ip}`) успешно добавлен!",
         'add_server_already_exists': "⚠️ Сервер с IP `{ip}` уже отслеживается.",
 
@@ -133,12 +179,24 @@ translations = {
         'remove_server_prompt': "*Выберите сервер для удаления:*",
         'remove_server_success': "✅ Сервер `{ip}` был удален.",
         'remove_server_not_found': "⚠️ Не удалось найти сервер `{ip}`. Возможно, он уже был удален.",
+        'server_gone': "⚠️ Этот сервер больше не отслеживается. Возможно, он был удален.",
 
         # Check Server
         'check_server_no_servers': "*Нет серверов для проверки.*",
         'check_server_prompt': "*Выберите сервер для мгновенной проверки:*",
         'check_server_checking': "*Проверяю* `{ip}`...",
         
+        # Probe Type
+        'probe_no_servers': "*Нет серверов для настройки.*",
+        'probe_server_prompt': "*Выберите сервер, чтобы изменить способ проверки:*",
+        'probe_type_prompt': "Как проверять `{ip}`?",
+        'probe_type_icmp': "ICMP (пинг)",
+        'probe_type_tcp': "TCP-соединение",
+        'probe_type_tls': "TLS-рукопожатие",
+        'probe_port_prompt': "Введите порт для проверки (например, `{port}`):",
+        'probe_invalid_port': "❌ *Неверный порт.*\nПожалуйста, введите число от 1 до 65535.",
+        'probe_updated': "✅ Сервер `{ip}` теперь проверяется через *{probe}*.",
+
         # List Servers
         'list_servers_no_servers': "*На данный момент нет отслеживаемых серверов.*",
         'list_servers_title': "📋 *Отслеживаемые серверы:*\n\n",
@@ -156,6 +214,9 @@ translations = {
         'monitoring_new_status': "Новый статус: *{status_text}*",
         'monitoring_server_name': "{flag} *{name}*",
         'monitoring_server_ip': "Сервер: `{ip}`",
+        'monitoring_digest_title': "🚨 *Изменился статус {count} серверов* 🚨",
+        'monitoring_digest_group': "{emoji} *{status_text}* ({count}):",
+        'monitoring_digest_line': "{flag} *{name}* (`{ip}`)",
 
         # Ping Report
         'ping_report_title': "📊 *Результат проверки для* {flag} *{name}* (`{ip}`)",
@@ -167,6 +228,9 @@ translations = {
         'ping_rtt_max': "   - Макс: `{ms:.3f} мс`",
         'ping_packet_loss': "📉 *Потеря пакетов:* `{loss}%`",
         'ping_offline_reason': "Причина: Сервер не отвечает на ICMP-запросы (пинг).",
+        'ping_offline_reason_dns': "Причина: Имя хоста не удаётся разрешить.",
+        'ping_offline_reason_tcp': "Причина: Сервер не принимает TCP-соединения на порту {port}.",
+        'ping_offline_reason_tls': "Причина: Сервер не завершает TLS-рукопожатие на порту {port}.",
         'ping_error': "Произошла ошибка при проверке `{ip}`.",
     }
 }
@@ -188,6 +252,61 @@ def get_user_language(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str
     return context.user_data.get('language', DEFAULT_LANGUAGE)
 
 
+class Template:
+    """
+    A catalog string split once into literal text and replacement fields, so
+    rendering only joins the pieces instead of parsing the format string again.
+    """
+    __slots__ = ('text', '_segments')
+
+    _CONVERSIONS = {'r': repr, 's': str, 'a': ascii}
+
+    def __init__(self, text):
+        self.text = text
+        segments = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if field is not None and (not field.isidentifier() or '{' in spec):
+                segments = None  # Indexed fields or nested specs are left to str.format
+                break
+            segments.append((literal, field, spec, self._CONVERSIONS.get(conversion)))
+        self._segments = segments
+
+    def render(self, **kwargs):
+        if not kwargs:
+            return self.text
+        if self._segments is None:
+            return self.text.format(**kwargs)
+        parts = []
+        for literal, field, spec, convert in self._segments:
+            parts.append(literal)
+            if field is not None:
+                value = kwargs[field]
+                if convert is not None:
+                    value = convert(value)
+                parts.append(format(value, spec))
+        return ''.join(parts)
+
+    def render_many(self, rows):
+        """Renders the template once per row (a dict of values)."""
+        render = self.render
+        return [render(**row) for row in rows]
+
+
+def _compile(catalog):
+    return {lang: {key: Template(text) for key, text in strings.items()} for lang, strings in catalog.items()}
+
+# The catalog prepared at startup
+templates = _compile(translations)
+
+
+def get_template(lang, key) -> Template:
+    """Returns the prepared template for a key, falling back like get_translation."""
+    template = templates.get(lang, templates[DEFAULT_LANGUAGE]).get(key)
+    if template is None:
+        template = Template(f"_{key}_")
+    return template
+
+
 def get_translation(lang, key, **kwargs):
     """
     Get a translated string for a given language and key.
@@ -196,10 +315,12 @@ def get_translation(lang, key, **kwargs):
     - **kwargs: Values to format the string with.
     """
     # Fallback to default language if the key is not in the selected language
-    translation = translations.get(lang, translations[DEFAULT_LANGUAGE]).get(key, f"_{key}_")
-    
-    # Format the string with any provided arguments
-    if kwargs:
-        return translation.format(**kwargs)
-    
-    return translation
+    return get_template(lang, key).render(**kwargs)
+
+
+def render_many(lang, key, rows):
+    """
+    Renders one translated line per row (a dict of values) with a single
+    catalog lookup, for list-style messages.
+    """
+    return get_template(lang, key).render_many(rows)
@@ -0,0 +1,184 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Per-logger levels as "logger=LEVEL,..."; they are applied on top of DEFAULT_LOGGER_LEVELS
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+# 'text' or 'json' (one JSON object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Log file; set it to an empty value to log to stderr
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+# Rotation: by size when LOG_MAX_BYTES > 0, otherwise by time when LOG_ROTATE_WHEN is set (e.g. 'midnight')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+# At most LOG_RATE_LIMIT repeats of one message per LOG_RATE_WINDOW seconds (0 disables the limit)
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))
+LOG_RATE_WINDOW = float(os.getenv('LOG_RATE_WINDOW', 60))
+
+# httpx logs every getUpdates long poll and apscheduler every job run at INFO
+DEFAULT_LOGGER_LEVELS = {
+    'httpx': 'WARNING',
+    'apscheduler': 'WARNING',
+}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge the arguments here, but keep the traceback apart so JSON output has it as a field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f" ({suppressed} repeats suppressed)"
+        return text
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `limit` repeats of one message per `window` seconds. A
+    message is the same when it comes from the same logging call with the same
+    text, so distinct events (a status change of each server, say) always get
+    through. The number of records dropped is attached, as `suppressed`, to the
+    first repeat that gets through in the next window. Errors are never dropped.
+    """
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self._limit = limit
+        self._window = window
+        self._messages = {}  # (logger, line, template, text hash) -> [window start, records in window, records suppressed]
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.lineno, str(record.msg), hash(record.getMessage()))
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned_at >= self._window:
+                # Messages that were not repeated within their window are forgotten
+                self._messages = {
+                    message: entry for message, entry in self._messages.items()
+                    if now - entry[0] < self._window or entry[2]
+                }
+                self._pruned_at = now
+            entry = self._messages.get(key)
+            if entry is None or now - entry[0] >= self._window:
+                suppressed = entry[2] if entry else 0
+                self._messages[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if entry[1] < self._limit:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            return False
+
+
+def _parse_levels(text: str) -> dict:
+    levels = {}
+    for item in text.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _build_handler() -> logging.Handler:
+    if not LOG_FILE:
+        return logging.StreamHandler(sys.stderr)
+    if LOG_MAX_BYTES > 0:
+        return logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.FileHandler(LOG_FILE, encoding='utf-8')
+
+
+def setup_logging():
+    """
+    Configures logging so that no handler I/O runs on the caller's thread: records
+    are put on a queue and written by a QueueListener thread to stderr or to a
+    rotating LOG_FILE, as text or JSON. Repetitive messages below ERROR are rate limited and
+    per-logger levels are applied.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = _build_handler()
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    if LOG_RATE_LIMIT > 0:
+        queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_WINDOW))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in {**DEFAULT_LOGGER_LEVELS, **_parse_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Writes the records still queued and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
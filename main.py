@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 import io
 import re
@@ -19,22 +20,28 @@ from telegram.ext import (
 
 import database as db
 import settings
-from countries import find_countries, get_country_name_by_code, get_flag_emoji
-from monitoring import run_monitoring_cycle
-from converter import RemnavaveSubscriptionConverter
-from ping import get_beautiful_report
-from localization import get_user_language, get_translation
+from countries import UNKNOWN_COUNTRY_CODE, find_countries, get_country_name_by_code, get_flag_emoji, infer_country_code
+from scheduler import MonitoringScheduler
+import history
+import metrics
+from logging_config import setup_logging
+from converter import RemnavaveSubscriptionConverter, close_http_client, parse_many
+from ping import get_beautiful_report, DEFAULT_PROBE_PORT
+from localization import get_user_language, get_translation, render_many
+from resolver import is_hostname, resolve, resolve_many
 
 # Load environment variables
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
 MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', 3))
+# Pause before the monitoring scheduler is restarted after a crash (seconds)
+SCHEDULER_RESTART_DELAY = 5
+# How often expired admin sessions are deleted from the database (seconds)
+SESSION_CLEANUP_INTERVAL = 60
 
 # Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Conversation states
@@ -47,7 +54,13 @@ logger = logging.getLogger(__name__)
     CONVERT_GET_URL,
     CHECK_SERVER_SELECT,
     INTERVAL_SELECT,
-) = range(8)
+    PROBE_SERVER_SELECT,
+    PROBE_TYPE_SELECT,
+    PROBE_PORT,
+    SERVER_INTERVAL_TARGET,
+    SERVER_INTERVAL_SELECT,
+    CONVERT_IMPORT,
+) = range(14)
 
 
 # --- Admin Authentication Decorator ---
@@ -66,6 +79,24 @@ def admin_only(func):
     return wrapped
 
 
+def reload_scheduler(context: ContextTypes.DEFAULT_TYPE):
+    """Makes the monitoring scheduler pick up changed servers or intervals."""
+    scheduler = context.bot_data.get('scheduler')
+    if scheduler:
+        scheduler.reload()
+
+
+async def selected_server(query, lang: str):
+    """
+    Returns the server picked on an inline keyboard, whose callback data ends
+    with its db.server_key(), or tells the admin it is gone and returns None.
+    """
+    server = db.get_server_by_key(query.data.rsplit('_', 1)[1])
+    if server is None:
+        await query.edit_message_text(text=get_translation(lang, 'server_gone'))
+    return server
+
+
 # --- Language Selection ---
 async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Sends a language selection menu."""
@@ -151,6 +182,16 @@ async def logout_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text(get_translation(lang, 'logout_success'), parse_mode=ParseMode.MARKDOWN)
 
 
+async def session_cleanup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job queue callback deleting expired admin sessions."""
+    try:
+        removed = await asyncio.to_thread(db.remove_expired_admins)
+        if removed:
+            logger.info(f"Deleted {removed} expired admin sessions.")
+    except Exception as e:
+        logger.error(f"Failed to delete expired admin sessions: {e}")
+
+
 # --- Interval Settings ---
 @admin_only
 async def interval_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -179,13 +220,7 @@ async def interval_selected(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     try:
         new_interval = settings.set_interval(preset)
-        
-        job_queue = context.job_queue
-        current_jobs = job_queue.get_jobs_by_name("monitoring_job")
-        for job in current_jobs:
-            job.schedule_removal()
-        
-        job_queue.run_repeating(run_monitoring_cycle, interval=new_interval, first=5, name="monitoring_job")
+        reload_scheduler(context)
         
         await query.edit_message_text(
             text=get_translation(lang, 'interval_updated', interval=new_interval),
@@ -202,6 +237,88 @@ async def interval_selected(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ConversationHandler.END
 
 
+# --- Per-Server Intervals ---
+@admin_only
+async def server_interval_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Starts the per-server interval conversation by asking for a country or a server."""
+    lang = get_user_language(update, context)
+    servers = db.get_all_servers()
+    if not servers:
+        await update.message.reply_text(get_translation(lang, 'server_interval_no_servers'), parse_mode=ParseMode.MARKDOWN)
+        return ConversationHandler.END
+
+    default_interval = settings.get_interval()
+    keyboard = []
+    countries = sorted({country_code for _, _, _, country_code, _, _, _ in servers})
+    for country_code in countries:
+        label = f"{get_flag_emoji(country_code)} {get_country_name_by_code(country_code, lang=lang)}"
+        keyboard.append([InlineKeyboardButton(
+            get_translation(lang, 'server_interval_country_button', country=label),
+            callback_data=f"sitarget_country_{country_code}"
+        )])
+    for ip, name, _, country_code, _, _, check_interval in servers:
+        label = f"{get_flag_emoji(country_code)} {name} ({ip}) — {check_interval or default_interval}s"
+        keyboard.append([InlineKeyboardButton(label, callback_data=f"sitarget_server_{db.server_key(ip)}")])
+
+    await update.message.reply_text(
+        get_translation(lang, 'server_interval_target_prompt', interval=default_interval),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return SERVER_INTERVAL_TARGET
+
+async def server_interval_target_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Asks for the interval to apply to the selected country or server."""
+    query = update.callback_query
+    await query.answer()
+    lang = get_user_language(update, context)
+
+    _, target_type, target = query.data.split('_', 2)
+    if target_type == 'server':
+        server = await selected_server(query, lang)
+        if server is None:
+            return ConversationHandler.END
+        target = server.ip_address
+    context.user_data['interval_target'] = (target_type, target)
+
+    keyboard = [
+        [InlineKeyboardButton(f"{seconds}s", callback_data=f"sivalue_{seconds}")]
+        for seconds in settings.SERVER_INTERVAL_PRESETS
+    ]
+    keyboard.append([InlineKeyboardButton(get_translation(lang, 'server_interval_default'), callback_data="sivalue_default")])
+
+    await query.edit_message_text(
+        text=get_translation(lang, 'server_interval_value_prompt', target=target),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return SERVER_INTERVAL_SELECT
+
+async def server_interval_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Saves the interval for the selected country or server."""
+    query = update.callback_query
+    await query.answer()
+    lang = get_user_language(update, context)
+
+    value = query.data.split('_')[1]
+    interval = None if value == 'default' else int(value)
+    target_type, target = context.user_data.pop('interval_target', (None, None))
+
+    if target_type == 'country':
+        updated = db.set_country_interval(target, interval)
+    else:
+        updated = int(db.set_server_interval(target, interval))
+    logger.info(f"SERVER_INTERVAL: Set {target_type} {target} to {interval} ({updated} servers).")
+    reload_scheduler(context)
+
+    interval_text = f"{interval}s" if interval else get_translation(lang, 'server_interval_default')
+    await query.edit_message_text(
+        text=get_translation(lang, 'server_interval_updated', target=target, interval=interval_text, count=updated),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return ConversationHandler.END
+
+
 # --- Converter (Conversation Handler) ---
 @admin_only
 async def convert_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -222,7 +339,8 @@ async def convert_url_received(update: Update, context: ContextTypes.DEFAULT_TYP
 
     try:
         converter = RemnavaveSubscriptionConverter(sub_url, verbose=False)
-        vless_keys = converter.convert_and_get_keys()
+        keys = parse_many(await converter.convert_and_get_keys_async())
+        vless_keys = [key.url for key in keys]
 
         if not vless_keys:
             await update.message.reply_text(get_translation(lang, 'convert_no_keys'), parse_mode=ParseMode.MARKDOWN)
@@ -245,13 +363,92 @@ async def convert_url_received(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception as e:
         logger.error(f"Error during conversion: {e}")
         await update.message.reply_text(get_translation(lang, 'convert_error'))
+        return ConversationHandler.END
+
+    # Offer to monitor the servers behind the keys
+    context.user_data['converted_keys'] = [(key.host, key.port, key.name) for key in keys]
+    keyboard = [[
+        InlineKeyboardButton(get_translation(lang, 'convert_import_button'), callback_data="importkeys_yes"),
+        InlineKeyboardButton(get_translation(lang, 'convert_import_skip_button'), callback_data="importkeys_no"),
+    ]]
+    await update.message.reply_text(
+        get_translation(lang, 'convert_import_prompt', count=len({key.host for key in keys})),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return CONVERT_IMPORT
+
+async def import_keys_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Adds the servers of the converted keys to monitoring in one go."""
+    query = update.callback_query
+    await query.answer()
+    lang = get_user_language(update, context)
+
+    keys = context.user_data.pop('converted_keys', None)
+    if query.data.split('_')[1] != 'yes' or not keys:
+        await query.edit_message_text(text=get_translation(lang, 'convert_import_skipped'))
+        return ConversationHandler.END
 
+    # One server per host; its first key decides the port and the name used to guess the country
+    endpoints = {}
+    for host, port, key_name in keys:
+        endpoints.setdefault(host.lower().rstrip("."), (port, key_name))
+
+    await query.edit_message_text(text=get_translation(lang, 'convert_import_resolving', count=len(endpoints)))
+    addresses = await resolve_many(endpoints)
+
+    # Servers may be monitored by hostname or by IP, so both are matched
+    monitored = set()
+    for server in db.get_all_servers():
+        monitored.add(server.ip_address)
+        monitored.add(addresses.get(server.ip_address, server.ip_address))
+    new_servers, added_by_country = {}, {}
+    already_monitored = unresolved = unknown_country = 0
+    for host, (port, key_name) in endpoints.items():
+        ip_address = addresses.get(host)
+        if ip_address is None:
+            unresolved += 1
+        elif host in monitored or ip_address in monitored:
+            already_monitored += 1
+        elif ip_address not in new_servers:
+            country_code = infer_country_code(key_name, host)
+            if country_code is None:
+                # Still monitored, under a placeholder country
+                country_code = UNKNOWN_COUNTRY_CODE
+                unknown_country += 1
+            name = next_server_name(country_code, added_by_country.get(country_code, 0))
+            added_by_country[country_code] = added_by_country.get(country_code, 0) + 1
+            # Servers are monitored by hostname so they follow DNS changes.
+            # The key's port is what the server actually serves, so it is checked with a TCP connect
+            new_servers[ip_address] = (host, country_code, name, 'tcp', port, ip_address)
+
+    added = db.add_servers(new_servers.values())
+    logger.info(f"IMPORT_KEYS: Added {len(added)} of {len(endpoints)} servers from converted keys.")
+    if added:
+        reload_scheduler(context)
+
+    await query.edit_message_text(
+        text=get_translation(
+            lang, 'convert_import_result',
+            added=len(added), existing=already_monitored, unresolved=unresolved, unknown=unknown_country
+        ),
+        parse_mode=ParseMode.MARKDOWN
+    )
     return ConversationHandler.END
 
 
 # --- Server Management (Conversation Handlers) ---
 
 # Add Server
+def next_server_name(country_code: str, pending: int = 0) -> str:
+    """
+    Names a new server after its country: 'Россия', then 'Россия-2' and so on.
+    `pending` counts servers of the country that are about to be added as well.
+    """
+    base_name = get_country_name_by_code(country_code, 'ru') # Use 'ru' for consistent naming
+    existing_count = db.count_servers_by_country(country_code) + pending
+    return f"{base_name}-{existing_count + 1}" if existing_count > 0 else base_name
+
 @admin_only
 async def add_server_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the add server conversation by asking for a country name."""
@@ -330,18 +527,25 @@ async def add_server_ip_received(update: Update, context: ContextTypes.DEFAULT_T
     ip_address = update.message.text.strip()
     country_code = context.user_data.get('selected_country')
 
-    if not re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", ip_address):
+    resolved_ip = None
+    if re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", ip_address):
+        pass
+    elif is_hostname(ip_address):
+        ip_address = ip_address.lower().rstrip('.')
+        resolved_ip = await resolve(ip_address)
+        if resolved_ip is None:
+            await update.message.reply_text(get_translation(lang, 'add_server_unresolved', host=ip_address), parse_mode=ParseMode.MARKDOWN)
+            return ADD_SERVER_IP
+    else:
         await update.message.reply_text(get_translation(lang, 'add_server_invalid_ip'), parse_mode=ParseMode.MARKDOWN)
         return ADD_SERVER_IP
 
-    base_name = get_country_name_by_code(country_code, 'ru') # Use 'ru' for consistent naming
-    existing_count = db.count_servers_by_country(country_code)
-    
-    new_name = f"{base_name}-{existing_count + 1}" if existing_count > 0 else base_name
+    new_name = next_server_name(country_code)
     
     logger.info(f"ADD_SERVER: Received IP: {ip_address}. Determined name: '{new_name}'")
 
-    if db.add_server(ip_address, country_code, new_name):
+    if db.add_server(ip_address, country_code, new_name, resolved_ip):
+        reload_scheduler(context)
         await update.message.reply_text(get_translation(lang, 'add_server_success', name=new_name, ip=ip_address), parse_mode=ParseMode.MARKDOWN)
     else:
         await update.message.reply_text(get_translation(lang, 'add_server_already_exists', ip=ip_address), parse_mode=ParseMode.MARKDOWN)
@@ -361,10 +565,10 @@ async def remove_server_start(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
 
     keyboard = []
-    for ip, name, _, country_code in servers:
+    for ip, name, _, country_code, _, _, _ in servers:
         flag_emoji = get_flag_emoji(country_code)
         label = f"{flag_emoji} {name} ({ip})"
-        keyboard.append([InlineKeyboardButton(label, callback_data=f"remove_{ip}")])
+        keyboard.append([InlineKeyboardButton(label, callback_data=f"remove_{db.server_key(ip)}")])
 
     await update.message.reply_text(
         get_translation(lang, 'remove_server_prompt'),
@@ -378,10 +582,14 @@ async def remove_server_selected(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     lang = get_user_language(update, context)
     
-    ip_to_remove = query.data.split('_')[1]
+    server = await selected_server(query, lang)
+    if server is None:
+        return ConversationHandler.END
+    ip_to_remove = server.ip_address
     logger.info(f"REMOVE_SERVER: Attempting to remove IP: {ip_to_remove}")
     
     if db.remove_server(ip_to_remove):
+        reload_scheduler(context)
         await query.edit_message_text(text=get_translation(lang, 'remove_server_success', ip=ip_to_remove), parse_mode=ParseMode.MARKDOWN)
     else:
         await query.edit_message_text(text=get_translation(lang, 'remove_server_not_found', ip=ip_to_remove), parse_mode=ParseMode.MARKDOWN)
@@ -400,10 +608,10 @@ async def check_server_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
 
     keyboard = []
-    for ip, name, _, country_code in servers:
+    for ip, name, _, country_code, _, _, _ in servers:
         flag_emoji = get_flag_emoji(country_code)
         label = f"{flag_emoji} {name} ({ip})"
-        keyboard.append([InlineKeyboardButton(label, callback_data=f"check_{ip}")])
+        keyboard.append([InlineKeyboardButton(label, callback_data=f"check_{db.server_key(ip)}")])
 
     await update.message.reply_text(
         get_translation(lang, 'check_server_prompt'),
@@ -413,40 +621,123 @@ async def check_server_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return CHECK_SERVER_SELECT
 
 async def check_server_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handles the server check, with extensive logging for debugging."""
+    """Handles the server check and replies with its report."""
     query = update.callback_query
     await query.answer()
     lang = get_user_language(update, context)
     
-    ip_to_check = query.data.split('_')[1]
-    logger.info(f"--- CHECK COMMAND DIAGNOSTICS for IP: {ip_to_check} ---")
-    
-    await query.edit_message_text(text=get_translation(lang, 'check_server_checking', ip=ip_to_check), parse_mode=ParseMode.MARKDOWN)
-    
-    server_details = db.get_server_details(ip_to_check)
-    logger.info(f"1. Raw server_details from DB: {server_details}")
-    
-    display_name = "Unknown"
-    flag_emoji = "🏳️"
+    server = await selected_server(query, lang)
+    if server is None:
+        return ConversationHandler.END
+    ip_to_check, display_name, _, country_code, probe_type, probe_port, _ = server
+    flag_emoji = get_flag_emoji(country_code)
 
-    if server_details:
-        _, name, _, country_code = server_details
-        logger.info(f"2. Extracted details -> Name: '{name}', Country Code: '{country_code}'")
-        display_name = name
-        flag_emoji = get_flag_emoji(country_code)
-    else:
-        logger.warning("1a. server_details from DB is None.")
+    await query.edit_message_text(text=get_translation(lang, 'check_server_checking', ip=ip_to_check), parse_mode=ParseMode.MARKDOWN)
 
-    logger.info(f"5. Final values for report -> IP: {ip_to_check}, Name: {display_name}, Flag: {flag_emoji}")
-    report = await get_beautiful_report(ip_to_check, display_name, flag_emoji, lang)
-    logger.info(f"6. Generated report string:\n{report}")
-    logger.info("--- END CHECK COMMAND DIAGNOSTICS ---")
+    report = await get_beautiful_report(ip_to_check, display_name, flag_emoji, lang, probe_type, probe_port)
+    logger.debug(f"CHECK_SERVER: {ip_to_check} ({display_name}) probed with {probe_type}/{probe_port}: {report!r}")
 
     await query.edit_message_text(text=report, parse_mode=ParseMode.MARKDOWN)
         
     return ConversationHandler.END
 
 
+# Probe Type
+@admin_only
+async def probe_type_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Starts the probe type conversation by asking for a server."""
+    lang = get_user_language(update, context)
+    servers = db.get_all_servers()
+    if not servers:
+        await update.message.reply_text(get_translation(lang, 'probe_no_servers'), parse_mode=ParseMode.MARKDOWN)
+        return ConversationHandler.END
+
+    keyboard = []
+    for ip, name, _, country_code, probe_type, probe_port, _ in servers:
+        flag_emoji = get_flag_emoji(country_code)
+        probe_label = probe_type.upper() if probe_type == 'icmp' else f"{probe_type.upper()}:{probe_port}"
+        label = f"{flag_emoji} {name} ({ip}) — {probe_label}"
+        keyboard.append([InlineKeyboardButton(label, callback_data=f"probe_{db.server_key(ip)}")])
+
+    await update.message.reply_text(
+        get_translation(lang, 'probe_server_prompt'),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return PROBE_SERVER_SELECT
+
+async def probe_server_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Asks which probe type to use for the selected server."""
+    query = update.callback_query
+    await query.answer()
+    lang = get_user_language(update, context)
+
+    server = await selected_server(query, lang)
+    if server is None:
+        return ConversationHandler.END
+    ip_address = server.ip_address
+    context.user_data['probe_server'] = ip_address
+
+    keyboard = [
+        [InlineKeyboardButton(get_translation(lang, 'probe_type_icmp'), callback_data="probetype_icmp")],
+        [InlineKeyboardButton(get_translation(lang, 'probe_type_tcp'), callback_data="probetype_tcp")],
+        [InlineKeyboardButton(get_translation(lang, 'probe_type_tls'), callback_data="probetype_tls")],
+    ]
+    await query.edit_message_text(
+        text=get_translation(lang, 'probe_type_prompt', ip=ip_address),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return PROBE_TYPE_SELECT
+
+async def probe_type_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Saves an ICMP probe right away, or asks for a port for TCP/TLS probes."""
+    query = update.callback_query
+    await query.answer()
+    lang = get_user_language(update, context)
+
+    probe_type = query.data.split('_')[1]
+    ip_address = context.user_data.get('probe_server')
+
+    if probe_type == 'icmp':
+        db.set_server_probe(ip_address, 'icmp', DEFAULT_PROBE_PORT)
+        reload_scheduler(context)
+        context.user_data.pop('probe_server', None)
+        await query.edit_message_text(
+            text=get_translation(lang, 'probe_updated', ip=ip_address, probe='ICMP'),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return ConversationHandler.END
+
+    context.user_data['probe_type'] = probe_type
+    await query.edit_message_text(
+        text=get_translation(lang, 'probe_port_prompt', port=DEFAULT_PROBE_PORT),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return PROBE_PORT
+
+async def probe_port_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Saves a TCP/TLS probe with the given port."""
+    lang = get_user_language(update, context)
+    port_text = update.message.text.strip()
+
+    if not port_text.isdigit() or not 1 <= int(port_text) <= 65535:
+        await update.message.reply_text(get_translation(lang, 'probe_invalid_port'), parse_mode=ParseMode.MARKDOWN)
+        return PROBE_PORT
+
+    ip_address = context.user_data.pop('probe_server', None)
+    probe_type = context.user_data.pop('probe_type', 'tcp')
+    db.set_server_probe(ip_address, probe_type, int(port_text))
+    reload_scheduler(context)
+    logger.info(f"PROBE: {ip_address} is now probed with {probe_type} on port {port_text}.")
+
+    await update.message.reply_text(
+        get_translation(lang, 'probe_updated', ip=ip_address, probe=f"{probe_type.upper()}:{port_text}"),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return ConversationHandler.END
+
+
 @admin_only
 async def list_servers_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Lists all monitored servers and their status."""
@@ -466,14 +757,15 @@ async def list_servers_command(update: Update, context: ContextTypes.DEFAULT_TYP
     }
     status_emojis = {'UP': '✅', 'DOWN': '❌', 'UNKNOWN': '❓'}
 
-    for ip, name, status, country_code in servers:
-        flag_emoji = get_flag_emoji(country_code)
-        status_text = status_translation.get(status, status)
-        status_emoji = status_emojis.get(status, '❓')
-        
-        message += f"{flag_emoji} *{name}* (`{ip}`)\n"
-        message += get_translation(lang, 'list_servers_status', emoji=status_emoji, status_text=status_text) + "\n\n"
-    
+    status_lines = render_many(lang, 'list_servers_status', (
+        {'emoji': status_emojis.get(status, '❓'), 'status_text': status_translation.get(status, status)}
+        for _, _, status, _, _, _, _ in servers
+    ))
+    message += "".join(
+        f"{get_flag_emoji(country_code)} *{name}* (`{ip}`)\n{status_line}\n\n"
+        for (ip, name, _, country_code, _, _, _), status_line in zip(servers, status_lines)
+    )
+
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
 
@@ -483,8 +775,30 @@ async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text(get_translation(lang, 'operation_cancelled'))
     # Clear only conversation-specific data, not the whole user_data
     context.user_data.pop('selected_country', None)
+    context.user_data.pop('probe_server', None)
+    context.user_data.pop('probe_type', None)
+    context.user_data.pop('interval_target', None)
+    context.user_data.pop('converted_keys', None)
     return ConversationHandler.END
 
+def start_scheduler(application: Application):
+    """Starts the monitoring scheduler; it is restarted if it ever stops with an error."""
+    scheduler = MonitoringScheduler(application)
+    application.bot_data['scheduler'] = scheduler
+    task = application.bot_data['scheduler_task'] = asyncio.create_task(scheduler.run())
+    task.add_done_callback(lambda t: on_scheduler_done(application, t))
+
+def on_scheduler_done(application: Application, task: asyncio.Task):
+    if task.cancelled() or not application.running:
+        return
+    logger.error("Monitoring scheduler stopped unexpectedly, restarting it.", exc_info=task.exception())
+
+    def restart():
+        if application.running:
+            start_scheduler(application)
+
+    asyncio.get_running_loop().call_later(SCHEDULER_RESTART_DELAY, restart)
+
 async def post_init(application: Application):
     """Post-initialization function to set bot commands."""
     commands = [
@@ -495,12 +809,27 @@ async def post_init(application: Application):
         BotCommand("removeserver", "➖ Remove a server"),
         BotCommand("listservers", "📋 List servers"),
         BotCommand("check", "🔎 Check a server"),
+        BotCommand("probetype", "📡 Set probe type"),
         BotCommand("convert", "🔄 Convert subscription"),
         BotCommand("interval", "⚙️ Set interval"),
+        BotCommand("serverinterval", "⏱ Set server interval"),
         BotCommand("language", "🌐 Select language"),
     ]
     await application.bot.set_my_commands(commands)
 
+    # Start monitoring
+    start_scheduler(application)
+    await metrics.start()
+
+async def post_shutdown(application: Application):
+    """Stops the monitoring scheduler, writes the remaining probe history and closes HTTP connections."""
+    task = application.bot_data.get('scheduler_task')
+    if task:
+        task.cancel()
+    await history.flush()
+    await close_http_client()
+    await metrics.stop()
+
 
 def main() -> None:
     """Run the bot."""
@@ -513,11 +842,15 @@ def main() -> None:
         logger.info(f"Starting with monitoring interval: {initial_interval} seconds.")
 
         # Create the Application and pass it your bot's token.
-        application = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).build()
-        
-        # --- Job Queue for Monitoring ---
+        application = (
+            Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
+        )
+
+        # --- Job Queue for Probe History and Admin Sessions ---
         job_queue = application.job_queue
-        job_queue.run_repeating(run_monitoring_cycle, interval=initial_interval, first=5, name="monitoring_job")
+        job_queue.run_repeating(history.flush_job, interval=history.FLUSH_INTERVAL, name="history_flush_job")
+        job_queue.run_repeating(history.rollup_job, interval=history.ROLLUP_INTERVAL, name="history_rollup_job")
+        job_queue.run_repeating(session_cleanup_job, interval=SESSION_CLEANUP_INTERVAL, name="session_cleanup_job")
 
         # --- Conversation Handlers ---
         add_server_conv = ConversationHandler(
@@ -558,10 +891,25 @@ def main() -> None:
             allow_reentry=True,
         )
 
+        probe_type_conv = ConversationHandler(
+            entry_points=[CommandHandler("probetype", probe_type_start)],
+            states={
+                PROBE_SERVER_SELECT: [CallbackQueryHandler(probe_server_selected, pattern="^probe_")],
+                PROBE_TYPE_SELECT: [CallbackQueryHandler(probe_type_selected, pattern="^probetype_")],
+                PROBE_PORT: [MessageHandler(filters.TEXT & ~filters.COMMAND, probe_port_received)],
+            },
+            fallbacks=[
+                CommandHandler("cancel", cancel_conversation),
+                MessageHandler(filters.COMMAND, cancel_conversation),
+            ],
+            allow_reentry=True,
+        )
+
         convert_conv = ConversationHandler(
             entry_points=[CommandHandler("convert", convert_start)],
             states={
-                CONVERT_GET_URL: [MessageHandler(filters.TEXT & ~filters.COMMAND, convert_url_received)]
+                CONVERT_GET_URL: [MessageHandler(filters.TEXT & ~filters.COMMAND, convert_url_received)],
+                CONVERT_IMPORT: [CallbackQueryHandler(import_keys_selected, pattern="^importkeys_")],
             },
             fallbacks=[
                 CommandHandler("cancel", cancel_conversation),
@@ -582,6 +930,19 @@ def main() -> None:
             allow_reentry=True,
         )
 
+        server_interval_conv = ConversationHandler(
+            entry_points=[CommandHandler("serverinterval", server_interval_start)],
+            states={
+                SERVER_INTERVAL_TARGET: [CallbackQueryHandler(server_interval_target_selected, pattern="^sitarget_")],
+                SERVER_INTERVAL_SELECT: [CallbackQueryHandler(server_interval_selected, pattern="^sivalue_")],
+            },
+            fallbacks=[
+                CommandHandler("cancel", cancel_conversation),
+                MessageHandler(filters.COMMAND, cancel_conversation),
+            ],
+            allow_reentry=True,
+        )
+
         # --- Command Handlers ---
         application.add_handler(CommandHandler("start", start_command))
         application.add_handler(CommandHandler("login", login_command))
@@ -594,8 +955,10 @@ def main() -> None:
         application.add_handler(add_server_conv)
         application.add_handler(remove_server_conv)
         application.add_handler(check_server_conv)
+        application.add_handler(probe_type_conv)
         application.add_handler(convert_conv)
         application.add_handler(interval_conv)
+        application.add_handler(server_interval_conv)
 
         # Run the bot until the user presses Ctrl-C
         logger.info("Bot is starting...")
@@ -0,0 +1,244 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+# Port of the local metrics endpoint (Prometheus text format); 0 disables metrics
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+ENABLED = METRICS_PORT > 0
+
+# How often the event loop lag is sampled (seconds)
+LOOP_LAG_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+_metrics = []
+# Database calls are also observed from asyncio.to_thread workers
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    Base class of the metrics below. Every update returns right away when metrics
+    are disabled, so instrumented code only pays for one global lookup.
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        _metrics.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; it can also be read from a callback when scraped."""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        super().__init__(name, documentation, labels)
+        self._functions = {}
+
+    def set(self, value, *labels):
+        if not ENABLED:
+            return
+        self._values[labels] = value
+
+    def set_function(self, function, *labels):
+        """Reads the value from `function()` on every scrape."""
+        if not ENABLED:
+            return
+        self._functions[labels] = function
+
+    def render(self):
+        for labels, function in list(self._functions.items()):
+            try:
+                self._values[labels] = function()
+            except Exception as e:
+                logger.error(f"METRICS: Failed to read {self.name}: {e}")
+        yield from super().render()
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets, labels=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        with _lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with _lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, labels, [f'le="{_format_value(float(bound))}"'])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            label_text = _format_labels(self.label_names, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(total)}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+def timed(histogram: Histogram):
+    """
+    Decorator that observes a function's run time in `histogram`, labelled with the
+    function's name. Returns the function unchanged when metrics are disabled.
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started_at, function.__name__)
+        return wrapper
+    return decorator
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+check_latency = Histogram(
+    'bot_check_latency_seconds', "Time from a server's due time until its probe result is handled, queue wait included.",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+probe_rtt = Histogram(
+    'bot_probe_rtt_milliseconds', "Average round-trip time of successful probes.",
+    (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600, 5000), labels=('probe_type',)
+)
+probe_duration = Histogram(
+    'bot_probe_duration_seconds', "Time a probe took, including retries of lost attempts.",
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20), labels=('probe_type',)
+)
+probes = Counter('bot_probes_total', "Probes finished, by probe type and result.", labels=('probe_type', 'status'))
+servers = Gauge('bot_servers', "Monitored servers by their current status.", labels=('status',))
+probe_queue_depth = Gauge('bot_probe_queue_depth', "Servers waiting in a probe pool queue.", labels=('pool',))
+db_call = Histogram('bot_db_call_seconds', "Duration of database calls.", LATENCY_BUCKETS, labels=('function',))
+telegram_send = Histogram('bot_telegram_send_seconds', "Duration of Telegram sendMessage calls.", LATENCY_BUCKETS)
+telegram_errors = Counter('bot_telegram_errors_total', "Failed Telegram sends, by error.", labels=('error',))
+loop_lag = Histogram('bot_event_loop_lag_seconds', "How late the event loop wakes up from a sleep.", LATENCY_BUCKETS)
+loop_lag_last = Gauge('bot_event_loop_lag_last_seconds', "Event loop lag at the last sample.")
+
+
+def render() -> str:
+    """Renders all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _watch_loop_lag():
+    while True:
+        started_at = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - started_at - LOOP_LAG_INTERVAL)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass  # Headers are not needed
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?', 1)[0] in ('/', '/metrics'):
+            status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', render().encode()
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, UnicodeDecodeError) as e:
+        logger.debug(f"METRICS: Request failed: {e!r}")
+    finally:
+        writer.close()
+
+
+_server = None
+_lag_task = None
+
+async def start():
+    """Starts the metrics endpoint and the event loop lag monitor, if metrics are enabled."""
+    global _server, _lag_task
+    if not ENABLED or _server is not None:
+        return
+    try:
+        _server = await asyncio.start_server(_handle_request, METRICS_HOST, METRICS_PORT)
+    except OSError as e:
+        logger.error(f"METRICS: Cannot listen on {METRICS_HOST}:{METRICS_PORT}: {e}")
+        return
+    _lag_task = asyncio.create_task(_watch_loop_lag())
+    logger.info(f"METRICS: Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+
+async def stop():
+    global _server, _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
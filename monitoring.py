@@ -1,66 +1,95 @@
 import asyncio
 import logging
-from database import get_all_servers, update_server_status, get_admins
-from ping import do_ping
-from countries import get_country_name_by_code, get_flag_emoji
-from localization import get_translation
+import os
+from database import get_all_servers, queue_server_status, update_resolved_ip
+import history
+import metrics
+from notifications import get_dispatcher
+import resolver
 
 logger = logging.getLogger(__name__)
 
-async def check_and_notify(app, ip_address, name, country_code, last_status):
-    """Checks a single server and sends a notification if the status changes."""
-    try:
-        ping_result = await do_ping(ip_address)
-        current_status = ping_result.status
+# Flap damping: consecutive results needed before a server's status is changed
+DOWN_AFTER_FAILURES = max(1, int(os.getenv('STATUS_DOWN_AFTER', 3)))
+UP_AFTER_SUCCESSES = max(1, int(os.getenv('STATUS_UP_AFTER', 2)))
+# Pause between confirmation re-probes of a server that looks changed (seconds)
+RECHECK_DELAY = float(os.getenv('STATUS_RECHECK_DELAY', 2))
+# Pool priority of confirmation re-probes, ahead of regular probes (0 and 1)
+CONFIRM_PRIORITY = -1
 
-        if current_status != last_status:
-            logger.info(f"Status change for {name} ({ip_address}): {last_status} -> {current_status}")
-            
-            await asyncio.to_thread(update_server_status, ip_address, current_status)
-            
-            admin_list = await asyncio.to_thread(get_admins)
-            if not admin_list:
-                return
+# Servers whose status change is being confirmed by re-probing
+_confirming = set()
 
-            notification_tasks = []
-            for chat_id, lang in admin_list:
-                flag_emoji = get_flag_emoji(country_code)
-                status_text_key = 'status_up' if current_status == 'UP' else 'status_down'
-                status_text = get_translation(lang, status_text_key)
-                
-                title = get_translation(lang, 'monitoring_status_change_title')
-                server_name_line = get_translation(lang, 'monitoring_server_name', flag=flag_emoji, name=name)
-                server_ip_line = get_translation(lang, 'monitoring_server_ip', ip=ip_address)
-                new_status_line = get_translation(lang, 'monitoring_new_status', status_text=status_text)
+def _on_address_change(host, old_ip, new_ip):
+    """Stores the new address of a monitored hostname, logging a change as a DNS event."""
+    previous_ip = update_resolved_ip(host, new_ip, old_ip)
+    if previous_ip and previous_ip != new_ip:
+        logger.info(f"DNS change for {host}: {previous_ip} -> {new_ip}")
 
-                message = f"{title}\n\n{server_name_line}\n{server_ip_line}\n{new_status_line}"
-                
-                notification_tasks.append(
-                    app.bot.send_message(chat_id=chat_id, text=message, parse_mode='Markdown')
-                )
-            
-            await asyncio.gather(*notification_tasks, return_exceptions=True)
+resolver.add_change_listener(_on_address_change)
 
-    except Exception as e:
-        logger.error(f"Error while checking server {ip_address}: {e}")
+def _count_servers(status):
+    return sum(1 for server in get_all_servers() if server.last_status == status)
+
+for _status in ('UP', 'DOWN', 'UNKNOWN'):
+    metrics.servers.set_function(lambda status=_status: _count_servers(status), _status)
+
+def _required_results(last_status, new_status):
+    if last_status not in ('UP', 'DOWN'):
+        return 1  # The first status of a new server is taken as is
+    return DOWN_AFTER_FAILURES if new_status == 'DOWN' else UP_AFTER_SUCCESSES
 
-async def run_monitoring_cycle(app):
+async def _confirm_status(pool, ip_address, last_status, new_status):
     """
-    A single cycle of the monitoring job. Runs all server checks concurrently.
+    Re-probes only this server, through the probe pool ahead of regular probes,
+    until `new_status` was seen the required number of times in a row. Returns
+    the confirmed status, or `last_status` if a probe disagreed (or failed) and
+    the change was a flap.
     """
-    logger.info("Starting concurrent monitoring cycle...")
-    
-    servers_to_check = await asyncio.to_thread(get_all_servers)
-    
-    if not servers_to_check:
-        logger.info("No servers to check.")
-        logger.info("Monitoring cycle finished.")
-        return
+    for _ in range(_required_results(last_status, new_status) - 1):
+        await asyncio.sleep(RECHECK_DELAY)
+        ping_result = await pool.probe(ip_address, CONFIRM_PRIORITY)
+        if ping_result is None:
+            return last_status
+        history.record(ip_address, ping_result)
+        if ping_result.status != new_status:
+            logger.info(f"Status of {ip_address} flapped to {new_status} and back to {ping_result.status}, ignored.")
+            return last_status
+    return new_status
 
-    tasks = []
-    for ip, name, last_status, country_code in servers_to_check:
-        tasks.append(check_and_notify(app, ip, name, country_code, last_status))
+async def handle_ping_result(app, pool, ip_address, name, country_code, last_status, ping_result):
+    """
+    Records a probe result. A changed status is confirmed by quick re-probes of
+    the server through `pool` first (see _confirm_status); once it is, the new status is stored
+    and admins are notified. Returns the server's status, or None if another
+    check is already confirming a change of this server.
+    """
+    try:
+        history.record(ip_address, ping_result)
+        current_status = ping_result.status
+        if current_status == last_status:
+            return last_status
+        if ip_address in _confirming:
+            return None
+
+        _confirming.add(ip_address)
+        try:
+            current_status = await _confirm_status(pool, ip_address, last_status, current_status)
+        finally:
+            _confirming.discard(ip_address)
+
+        if current_status != last_status:
+            logger.info(f"Status change for {name} ({ip_address}): {last_status} -> {current_status}")
+            queue_server_status(ip_address, last_status, current_status)
+            get_dispatcher(app.bot).notify_status_change(ip_address, name, country_code, last_status, current_status)
+        return current_status
+
+    except Exception as e:
+        logger.error(f"Error while checking server {ip_address}: {e}")
+        return None
 
-    await asyncio.gather(*tasks, return_exceptions=True)
-    
-    logger.info("Monitoring cycle finished.")
+def log_pool_stats(stats):
+    logger.info(
+        f"Probe pool: {stats.probes} probes, queue wait avg {stats.avg_wait:.2f}s / max {stats.max_wait:.2f}s, "
+        f"probe time avg {stats.avg_probe:.2f}s / max {stats.max_probe:.2f}s"
+    )
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import metrics
+from countries import get_flag_emoji
+from database import get_admins
+from localization import get_translation, render_many
+
+logger = logging.getLogger(__name__)
+
+# Status changes arriving within this window are sent as one digest per admin (seconds)
+DIGEST_WINDOW = 5.0
+# Telegram allows about 30 messages per second overall and one per second per chat
+GLOBAL_SEND_INTERVAL = 1 / 30
+CHAT_SEND_INTERVAL = 1.0
+# Attempts for a message that fails with a network error
+MAX_ATTEMPTS = 3
+MAX_MESSAGE_LENGTH = 4096
+
+STATUS_EMOJIS = {'UP': '✅', 'DOWN': '❌'}
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+
+def _split_message(lines, limit=MAX_MESSAGE_LENGTH):
+    """Joins lines into as few messages as possible, each within Telegram's length limit."""
+    messages, current = [], ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+class NotificationDispatcher:
+    """
+    Central queue for status change notifications. Changes are coalesced for
+    DIGEST_WINDOW seconds into one message (or digest) per admin, and messages are
+    sent within Telegram's global and per-chat rate limits, honouring retry_after.
+    Every chat has its own queue and sender, so a chat that has to wait (or keeps
+    failing) does not hold up messages to the others.
+    """
+
+    def __init__(self, bot):
+        self._bot = bot
+        self._changes = {}  # ip -> [name, country_code, first old status, latest status]
+        self._window = None
+        self._queues = {}  # chat_id -> asyncio.Queue of messages
+        self._senders = {}  # chat_id -> sender task
+        self._next_send = 0.0
+
+    def notify_status_change(self, ip_address, name, country_code, old_status, new_status):
+        """Queues a status change; it is sent with the other changes of the current window."""
+        change = self._changes.get(ip_address)
+        if change:
+            change[3] = new_status
+        else:
+            self._changes[ip_address] = [name, country_code, old_status, new_status]
+
+        if self._window is None:
+            self._window = asyncio.create_task(self._close_window())
+
+    async def _close_window(self):
+        await asyncio.sleep(DIGEST_WINDOW)
+        self._window = None
+        self._enqueue_changes()
+
+    def _enqueue_changes(self):
+        changes, self._changes = self._changes, {}
+        # A server that flapped back to its original status within the window is not reported
+        changes = {ip: change for ip, change in changes.items() if change[2] != change[3]}
+        if not changes:
+            return
+
+        messages_by_lang = {}
+        for chat_id, lang in get_admins():
+            if lang not in messages_by_lang:
+                messages_by_lang[lang] = self._render(lang, changes)
+            for message in messages_by_lang[lang]:
+                self._enqueue(chat_id, message)
+
+    def _enqueue(self, chat_id, text):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        queue.put_nowait(text)
+        sender = self._senders.get(chat_id)
+        if sender is None or sender.done():
+            self._senders[chat_id] = asyncio.create_task(self._send_loop(chat_id, queue))
+
+    @staticmethod
+    def _render(lang, changes):
+        status_texts = {
+            'UP': get_translation(lang, 'status_up'),
+            'DOWN': get_translation(lang, 'status_down'),
+        }
+
+        if len(changes) == 1:
+            ip, (name, country_code, _, new_status) = next(iter(changes.items()))
+            title = get_translation(lang, 'monitoring_status_change_title')
+            server_name_line = get_translation(lang, 'monitoring_server_name', flag=get_flag_emoji(country_code), name=name)
+            server_ip_line = get_translation(lang, 'monitoring_server_ip', ip=ip)
+            new_status_line = get_translation(
+                lang, 'monitoring_new_status', status_text=status_texts.get(new_status, new_status)
+            )
+            return [f"{title}\n\n{server_name_line}\n{server_ip_line}\n{new_status_line}"]
+
+        lines = [get_translation(lang, 'monitoring_digest_title', count=len(changes))]
+        for status in ('DOWN', 'UP'):
+            group = [(ip, change) for ip, change in changes.items() if change[3] == status]
+            if not group:
+                continue
+            lines.append("")
+            lines.append(get_translation(
+                lang, 'monitoring_digest_group',
+                emoji=STATUS_EMOJIS[status], status_text=status_texts[status], count=len(group)
+            ))
+            lines.extend(render_many(lang, 'monitoring_digest_line', (
+                {'flag': get_flag_emoji(country_code), 'name': name, 'ip': ip}
+                for ip, (name, country_code, _, _) in group
+            )))
+        return _split_message(lines)
+
+    async def _wait_for_send_slot(self):
+        """Waits until the global rate limit (or a retry_after pause) allows the next message."""
+        while True:
+            now = time.monotonic()
+            if self._next_send <= now:
+                self._next_send = now + GLOBAL_SEND_INTERVAL
+                return
+            await asyncio.sleep(self._next_send - now)
+
+    async def _send(self, chat_id, text):
+        """Sends one message, retrying rate limits and network errors. Returns False if it was dropped."""
+        attempt = 1
+        while True:
+            await self._wait_for_send_slot()
+            started_at = time.perf_counter()
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+                return True
+            except RetryAfter as e:
+                metrics.telegram_errors.inc('retry_after')
+                retry_after = _retry_after_seconds(e)
+                logger.warning(f"Telegram rate limit hit, retrying in {retry_after}s.")
+                self._next_send = max(self._next_send, time.monotonic() + retry_after)
+            except (BadRequest, Forbidden) as e:
+                # Malformed messages, unknown or blocked chats: retrying will not help
+                metrics.telegram_errors.inc('rejected')
+                logger.error(f"Telegram rejected the notification to {chat_id}: {e}")
+                return False
+            except NetworkError as e:
+                metrics.telegram_errors.inc('network')
+                if attempt >= MAX_ATTEMPTS:
+                    logger.error(f"Giving up notifying {chat_id}: {e}")
+                    return False
+                logger.warning(f"Network error notifying {chat_id} (attempt {attempt}): {e}")
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+            except Exception as e:
+                metrics.telegram_errors.inc('other')
+                logger.error(f"Failed to notify {chat_id}: {e}")
+                return False
+            finally:
+                metrics.telegram_send.observe(time.perf_counter() - started_at)
+
+    async def _send_loop(self, chat_id, queue: asyncio.Queue):
+        next_send = 0.0
+        while True:
+            text = await queue.get()
+            try:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._send(chat_id, text)
+                next_send = time.monotonic() + CHAT_SEND_INTERVAL
+            finally:
+                queue.task_done()
+
+
+_dispatchers = {}
+
+def get_dispatcher(bot) -> NotificationDispatcher:
+    """Returns the notification dispatcher of a bot, creating it on first use."""
+    dispatcher = _dispatchers.get(id(bot))
+    if dispatcher is None:
+        dispatcher = _dispatchers[id(bot)] = NotificationDispatcher(bot)
+    return dispatcher
@@ -1,18 +1,55 @@
 import asyncio
+import os
 import re
 import logging
+import ssl
+import time
 from collections import namedtuple
+import metrics
 from localization import get_translation
+from icmp import get_icmp_socket
+from resolver import is_ipv4, resolve
 
 logger = logging.getLogger(__name__)
 PingResult = namedtuple('PingResult', ['status', 'packet_loss', 'min_rtt', 'avg_rtt', 'max_rtt'])
 
-async def do_ping(ip_address: str) -> PingResult:
+# Probe parameters, mirroring the previous `ping -c 4 -W 5` invocation
+PING_COUNT = 4
+PING_INTERVAL = 1.0
+PING_TIMEOUT = 5.0
+
+# Adaptive probing: a server is DOWN after this many consecutive lost attempts
+PROBE_MAX_LOSSES = max(1, int(os.getenv('PROBE_MAX_LOSSES', 3)))
+
+# Probe types a server can be monitored with
+PROBE_TYPES = ('icmp', 'tcp', 'tls')
+DEFAULT_PROBE_PORT = 443
+
+# Endpoints often present self-signed or Reality certificates, so only the handshake is timed
+_TLS_CONTEXT = ssl.create_default_context()
+_TLS_CONTEXT.check_hostname = False
+_TLS_CONTEXT.verify_mode = ssl.CERT_NONE
+
+def _summarize(rtts) -> PingResult:
+    """Builds a PingResult from per-packet RTTs, where None marks a lost packet."""
+    replies = [rtt for rtt in rtts if rtt is not None]
+    if not replies:
+        return PingResult(status='DOWN', packet_loss=100.0, min_rtt=0, avg_rtt=0, max_rtt=0)
+
+    return PingResult(
+        status='UP',
+        packet_loss=round(100.0 * (len(rtts) - len(replies)) / len(rtts), 1),
+        min_rtt=round(min(replies), 3),
+        avg_rtt=round(sum(replies) / len(replies), 3),
+        max_rtt=round(max(replies), 3)
+    )
+
+async def _system_ping(ip_address: str) -> PingResult:
     """
     Performs a system ping command and parses its output.
-    Increased timeout to 5 seconds for more reliability.
+    Only used when ICMP sockets are not permitted for this process.
     """
-    command = f"ping -c 4 -W 5 {ip_address}"
+    command = f"ping -c {PING_COUNT} -W {int(PING_TIMEOUT)} {ip_address}"
     process = await asyncio.create_subprocess_shell(
         command,
         stdout=asyncio.subprocess.PIPE,
@@ -46,12 +83,150 @@ async def do_ping(ip_address: str) -> PingResult:
         max_rtt=max_rtt
     )
 
-async def get_beautiful_report(ip_address: str, country_name: str, flag_emoji: str, lang: str = 'ru') -> str:
+async def do_ping(ip_address: str) -> PingResult:
+    """
+    Pings a server from within the process using the shared ICMP socket.
+    Sends PING_COUNT echo requests PING_INTERVAL apart, each waiting up to PING_TIMEOUT.
+    Falls back to the system ping when ICMP sockets are not permitted.
+    """
+    icmp = get_icmp_socket()
+    if icmp is None:
+        return await _system_ping(ip_address)
+
+    async def attempt(index):
+        await asyncio.sleep(index * PING_INTERVAL)
+        return await icmp.send_echo(ip_address, PING_TIMEOUT)
+
+    rtts = await asyncio.gather(*(attempt(i) for i in range(PING_COUNT)))
+    return _summarize(rtts)
+
+def _offline_reason(lang: str, probe_type: str, port: int) -> str:
+    if probe_type == 'dns':
+        return get_translation(lang, 'ping_offline_reason_dns')
+    if probe_type == 'tcp':
+        return get_translation(lang, 'ping_offline_reason_tcp', port=port or DEFAULT_PROBE_PORT)
+    if probe_type == 'tls':
+        return get_translation(lang, 'ping_offline_reason_tls', port=port or DEFAULT_PROBE_PORT)
+    return get_translation(lang, 'ping_offline_reason')
+
+async def _connect_time(host: str, port: int, timeout: float, use_tls: bool, server_hostname: str = None):
+    """
+    Times a non-blocking TCP connect (and TLS handshake if `use_tls`).
+    `server_hostname` is sent as SNI when `host` is an address the hostname resolved to.
+    Returns the time in milliseconds, or None if the attempt failed.
+    """
+    loop = asyncio.get_running_loop()
+    tls_options = {'ssl': _TLS_CONTEXT, 'server_hostname': server_hostname} if use_tls else {}
+    started_at = time.perf_counter()
+    try:
+        transport, _ = await asyncio.wait_for(
+            loop.create_connection(asyncio.Protocol, host, port, **tls_options),
+            timeout
+        )
+    except (OSError, asyncio.TimeoutError, ssl.SSLError) as e:
+        logger.debug(f"Connect to {host}:{port} failed: {e!r}")
+        return None
+    elapsed = (time.perf_counter() - started_at) * 1000
+    transport.abort()
+    return elapsed
+
+async def connect_ping(host: str, port: int, use_tls: bool = False, count: int = PING_COUNT,
+                       interval: float = PING_INTERVAL, timeout: float = PING_TIMEOUT,
+                       server_hostname: str = None) -> PingResult:
+    """
+    Probes a server by timing `count` TCP connects (or TLS handshakes), started
+    `interval` apart. Loss and RTT are reported exactly like an ICMP ping.
+    """
+    async def attempt(index):
+        await asyncio.sleep(index * interval)
+        return await _connect_time(host, port, timeout, use_tls, server_hostname)
+
+    rtts = await asyncio.gather(*(attempt(i) for i in range(count)))
+    return _summarize(rtts)
+
+async def _adaptive_probe(attempt, max_losses: int, interval: float) -> PingResult:
     """
-    Performs a ping and generates a beautiful, localized text report.
+    Runs probe attempts until the first reply. A new attempt is only started when
+    no reply arrived within `interval`, and the server is DOWN once `max_losses`
+    attempts in a row were lost. `attempt` returns an awaitable of the RTT or None.
     """
+    pending = set()
+    sent = lost = 0
     try:
-        result = await do_ping(ip_address)
+        while True:
+            if sent < max_losses:
+                pending.add(asyncio.ensure_future(attempt()))
+                sent += 1
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=interval if sent < max_losses else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for finished in done:
+                rtt = finished.result()
+                if rtt is not None:
+                    return _summarize([rtt] + [None] * lost)
+                lost += 1
+            if lost >= max_losses:
+                return _summarize([None] * lost)
+    finally:
+        for unfinished in pending:
+            unfinished.cancel()
+
+async def probe_server(ip_address: str, probe_type: str = 'icmp', port: int = None,
+                       adaptive: bool = False) -> PingResult:
+    """
+    Probes a server with its configured probe type.
+    With `adaptive`, probing stops at the first reply and only retries on loss
+    (see _adaptive_probe); otherwise full PING_COUNT statistics are collected.
+    A hostname is probed at the address cached by the shared resolver, and
+    is DOWN if it does not resolve.
+    """
+    started_at = time.perf_counter()
+    result = await _probe_server(ip_address, probe_type, port, adaptive)
+    metrics.probe_duration.observe(time.perf_counter() - started_at, probe_type)
+    metrics.probes.inc(probe_type, result.status)
+    if result.status == 'UP':
+        metrics.probe_rtt.observe(result.avg_rtt, probe_type)
+    return result
+
+async def _probe_server(address: str, probe_type: str, port: int, adaptive: bool) -> PingResult:
+    ip_address = await resolve(address)
+    if ip_address is None:
+        return _summarize([None])
+
+    if probe_type in ('tcp', 'tls'):
+        port = port or DEFAULT_PROBE_PORT
+        use_tls = (probe_type == 'tls')
+        # The handshake goes to the resolved IP, but the certificate is chosen by the hostname
+        server_hostname = None if is_ipv4(address) else address
+        if adaptive:
+            return await _adaptive_probe(
+                lambda: _connect_time(ip_address, port, PING_TIMEOUT, use_tls, server_hostname),
+                PROBE_MAX_LOSSES, PING_INTERVAL
+            )
+        return await connect_ping(ip_address, port, use_tls=use_tls, server_hostname=server_hostname)
+
+    # Every ICMP probe shares one socket, so the probes the pool runs at once are interleaved
+    # like one fping round: a reply ends a probe after one RTT, and a dead server is DOWN after
+    # (PROBE_MAX_LOSSES - 1) * PING_INTERVAL + PING_TIMEOUT, however many servers are probed
+    icmp = get_icmp_socket()
+    if adaptive and icmp is not None:
+        return await _adaptive_probe(
+            lambda: icmp.send_echo(ip_address, PING_TIMEOUT), PROBE_MAX_LOSSES, PING_INTERVAL
+        )
+    return await do_ping(ip_address)
+
+async def get_beautiful_report(ip_address: str, country_name: str, flag_emoji: str, lang: str = 'ru',
+                               probe_type: str = 'icmp', port: int = None) -> str:
+    """
+    Performs a probe and generates a beautiful, localized text report.
+    """
+    try:
+        if not is_ipv4(ip_address) and await resolve(ip_address) is None:
+            result, probe_type = _summarize([None]), 'dns'
+        else:
+            result = await probe_server(ip_address, probe_type, port)
 
         header = get_translation(lang, 'ping_report_title', flag=flag_emoji, name=country_name, ip=ip_address)
 
@@ -71,7 +246,7 @@ async def get_beautiful_report(ip_address: str, country_name: str, flag_emoji: s
             report = (
                 f"{header}\n\n"
                 f"{status_line}\n\n"
-                f"{get_translation(lang, 'ping_offline_reason')}"
+                f"{_offline_reason(lang, probe_type, port)}"
             )
         
         return report
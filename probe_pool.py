@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on probes running at the same time, to stay clear of fd and process limits
+MAX_IN_FLIGHT = int(os.getenv('PROBE_MAX_IN_FLIGHT', 500))
+
+PoolStats = namedtuple('PoolStats', ['probes', 'avg_wait', 'max_wait', 'avg_probe', 'max_probe'])
+
+
+class ProbePool:
+    """
+    A bounded worker pool for monitoring probes.
+    Work items are taken from a priority queue (FIFO within the same priority)
+    and probed by at most `max_in_flight` workers at a time.
+    """
+
+    def __init__(self, probe, max_in_flight: int = MAX_IN_FLIGHT):
+        self._probe = probe
+        self._max_in_flight = max(1, max_in_flight)
+        self._queue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._probes = 0
+        self._wait_total = self._wait_max = 0.0
+        self._probe_total = self._probe_max = 0.0
+
+    def submit(self, key, priority: int = 0):
+        """Queues `key` for probing. Lower priorities are probed first."""
+        self._queue.put_nowait((priority, next(self._order), time.perf_counter(), key, None))
+
+    async def probe(self, key, priority: int = 0):
+        """
+        Probes `key` through the pool and returns its result directly instead of
+        through run(); None if the probe raised an error. Only completes while
+        the pool is running.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((priority, next(self._order), time.perf_counter(), key, future))
+        return await future
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def _worker(self, results: asyncio.Queue):
+        while True:
+            _, _, queued_at, key, future = await self._queue.get()
+            if future is not None and future.done():
+                continue  # The caller stopped waiting
+            started_at = time.perf_counter()
+            try:
+                result = await self._probe(key)
+            except Exception as e:
+                logger.error(f"Error while probing {key}: {e}")
+                result = None
+            finished_at = time.perf_counter()
+
+            self._probes += 1
+            self._wait_total += started_at - queued_at
+            self._wait_max = max(self._wait_max, started_at - queued_at)
+            self._probe_total += finished_at - started_at
+            self._probe_max = max(self._probe_max, finished_at - started_at)
+            if future is None:
+                results.put_nowait((key, result))
+            elif not future.done():
+                future.set_result(result)
+
+    async def run(self):
+        """
+        Yields (key, result) pairs as probes finish, until cancelled; `result` is
+        None if the probe raised an error. Items may be submitted while the pool runs.
+        """
+        results = asyncio.Queue()
+        workers = [asyncio.create_task(self._worker(results)) for _ in range(self._max_in_flight)]
+        try:
+            while True:
+                yield await results.get()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    def stats(self, reset: bool = False) -> PoolStats:
+        """
+        Returns queue wait and probe time statistics (in seconds) since the pool
+        was created, or since the last call with `reset`.
+        """
+        probes = self._probes
+        if not probes:
+            stats = PoolStats(probes=0, avg_wait=0, max_wait=0, avg_probe=0, max_probe=0)
+        else:
+            stats = PoolStats(
+                probes=probes,
+                avg_wait=self._wait_total / probes,
+                max_wait=self._wait_max,
+                avg_probe=self._probe_total / probes,
+                max_probe=self._probe_max
+            )
+        if reset:
+            self._reset_stats()
+        return stats
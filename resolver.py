@@ -0,0 +1,263 @@
+import asyncio
+import ipaddress
+import logging
+import random
+import re
+import socket
+import struct
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Record TTLs are clamped to this range (seconds)
+MIN_TTL = 30
+MAX_TTL = 3600
+# TTL for answers without one (the system resolver fallback and /etc/hosts)
+DEFAULT_TTL = 300
+# How long a failed lookup is cached; a host that resolved before keeps its last address meanwhile
+NEGATIVE_CACHE_TTL = 60
+# Upper bound on lookups running at the same time
+MAX_CONCURRENT_LOOKUPS = 50
+QUERY_TIMEOUT = 2.0
+
+RESOLV_CONF = '/etc/resolv.conf'
+HOSTS_FILE = '/etc/hosts'
+
+DNS_TYPE_A = 1
+DNS_TYPE_CNAME = 5
+DNS_RCODE_NXDOMAIN = 3
+
+_HOSTNAME_PATTERN = re.compile(r'^(?=.{1,253}\.?$)(?:[A-Za-z0-9_](?:[A-Za-z0-9_-]{0,61}[A-Za-z0-9])?\.)*'
+                               r'[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.?$')
+
+_cache = {}  # host -> (ip or None, expires_at)
+_in_flight = {}  # host -> task of a lookup that is already running
+_change_listeners = []
+_nameservers = None
+_hosts = None
+
+
+class DnsError(Exception):
+    pass
+
+
+def is_ipv4(address: str) -> bool:
+    try:
+        ipaddress.IPv4Address(address)
+        return True
+    except ValueError:
+        return False
+
+
+def is_hostname(address: str) -> bool:
+    """Checks that a string is a syntactically valid DNS hostname (not an IP address)."""
+    return not is_ipv4(address) and bool(_HOSTNAME_PATTERN.match(address)) and not address.replace('.', '').isdigit()
+
+
+def add_change_listener(callback: Callable[[str, Optional[str], str], None]):
+    """
+    Registers `callback(host, old_ip, new_ip)`, called whenever a host resolves
+    to a different address than before (old_ip is None on its first resolution).
+    """
+    _change_listeners.append(callback)
+
+
+def _load_nameservers() -> List[str]:
+    global _nameservers
+    if _nameservers is None:
+        _nameservers = []
+        try:
+            with open(RESOLV_CONF) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 2 and fields[0] == 'nameserver' and is_ipv4(fields[1]):
+                        _nameservers.append(fields[1])
+        except OSError as e:
+            logger.warning(f"DNS: Cannot read {RESOLV_CONF} ({e}), using the system resolver.")
+    return _nameservers
+
+
+def _load_hosts() -> Dict[str, str]:
+    global _hosts
+    if _hosts is None:
+        _hosts = {}
+        try:
+            with open(HOSTS_FILE) as f:
+                for line in f:
+                    fields = line.split('#', 1)[0].split()
+                    if len(fields) >= 2 and is_ipv4(fields[0]):
+                        for name in fields[1:]:
+                            _hosts.setdefault(name.lower(), fields[0])
+        except OSError:
+            pass
+    return _hosts
+
+
+def _build_query(query_id: int, host: str) -> bytes:
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)  # Recursion desired, one question
+    question = b''.join(bytes([len(label)]) + label for label in host.encode('idna').split(b'.') if label)
+    return header + question + b'\x00' + struct.pack('!HH', DNS_TYPE_A, 1)
+
+
+def _skip_name(message: bytes, offset: int) -> int:
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:  # Compression pointer
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+
+def _parse_response(message: bytes, query_id: int) -> Tuple[Optional[str], int]:
+    """Returns (first A record or None, smallest TTL along the answer chain)."""
+    response_id, flags, questions, answers, _, _ = struct.unpack('!HHHHHH', message[:12])
+    if response_id != query_id or not flags & 0x8000:
+        raise DnsError("unexpected response")
+    if flags & 0x0200:
+        raise DnsError("truncated response")
+    rcode = flags & 0x000F
+    if rcode == DNS_RCODE_NXDOMAIN:
+        return None, NEGATIVE_CACHE_TTL
+    if rcode:
+        raise DnsError(f"server failure (rcode {rcode})")
+
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(message, offset) + 4
+
+    ttl = MAX_TTL
+    for _ in range(answers):
+        offset = _skip_name(message, offset)
+        record_type, _, record_ttl, length = struct.unpack('!HHIH', message[offset:offset + 10])
+        offset += 10
+        if record_type in (DNS_TYPE_A, DNS_TYPE_CNAME):
+            ttl = min(ttl, record_ttl)
+        if record_type == DNS_TYPE_A and length == 4:
+            return socket.inet_ntoa(message[offset:offset + 4]), ttl
+        offset += length
+    return None, NEGATIVE_CACHE_TTL
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future: asyncio.Future):
+        self._future = future
+
+    def datagram_received(self, data, addr):
+        if not self._future.done():
+            self._future.set_result(data)
+
+    def error_received(self, exc):
+        if not self._future.done():
+            self._future.set_exception(exc)
+
+
+async def _query(nameserver: str, host: str) -> Tuple[Optional[str], int]:
+    loop = asyncio.get_running_loop()
+    query_id = random.getrandbits(16)
+    future = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _DnsProtocol(future), remote_addr=(nameserver, 53)
+    )
+    try:
+        transport.sendto(_build_query(query_id, host))
+        message = await asyncio.wait_for(future, QUERY_TIMEOUT)
+    finally:
+        transport.close()
+    try:
+        return _parse_response(message, query_id)
+    except (struct.error, IndexError) as e:
+        raise DnsError(f"malformed response: {e}")
+
+
+async def _system_lookup(host: str) -> Tuple[Optional[str], int]:
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        logger.warning(f"DNS: Failed to resolve {host}: {e}")
+        return None, NEGATIVE_CACHE_TTL
+    return (infos[0][4][0] if infos else None), DEFAULT_TTL
+
+
+async def _lookup(host: str) -> Tuple[Optional[str], int]:
+    hosts = _load_hosts()
+    if host in hosts:
+        return hosts[host], MAX_TTL
+
+    # Single-label names depend on search domains, which only the system resolver knows
+    nameservers = _load_nameservers() if '.' in host else []
+    for nameserver in nameservers:
+        try:
+            return await _query(nameserver, host)
+        except (DnsError, OSError, asyncio.TimeoutError) as e:
+            logger.debug(f"DNS: Query for {host} to {nameserver} failed: {e!r}")
+    return await _system_lookup(host)
+
+
+async def _refresh(host: str) -> Optional[str]:
+    previous = _cache.get(host, (None, 0))[0]
+    try:
+        ip_address, ttl = await _lookup(host)
+    except Exception as e:
+        logger.error(f"DNS: Unexpected error resolving {host}: {e}")
+        ip_address, ttl = None, NEGATIVE_CACHE_TTL
+
+    if ip_address is None:
+        if previous is not None:
+            logger.warning(f"DNS: {host} did not resolve, keeping its last address {previous}.")
+        _cache[host] = (previous, time.monotonic() + NEGATIVE_CACHE_TTL)
+        return previous
+
+    _cache[host] = (ip_address, time.monotonic() + max(MIN_TTL, min(ttl, MAX_TTL)))
+    if ip_address != previous:
+        for listener in _change_listeners:
+            try:
+                listener(host, previous, ip_address)
+            except Exception as e:
+                logger.error(f"DNS: Change listener failed for {host}: {e}")
+    return ip_address
+
+
+def _start_refresh(host: str) -> asyncio.Task:
+    task = _in_flight.get(host)
+    if task is None:
+        task = _in_flight[host] = asyncio.ensure_future(_refresh(host))
+        task.add_done_callback(lambda _: _in_flight.pop(host, None))
+    return task
+
+
+async def resolve(host: str) -> Optional[str]:
+    """
+    Resolves a hostname to an IPv4 address, or returns None if it does not resolve.
+    IPv4 literals are returned as is. Answers are cached for their record TTL and
+    failures for NEGATIVE_CACHE_TTL. Once a cached address expires it is still
+    returned while a single background lookup refreshes it, so callers only wait
+    for DNS the first time a host is seen.
+    """
+    if is_ipv4(host):
+        return host
+
+    host = host.lower().rstrip('.')
+    cached = _cache.get(host)
+    if cached is not None:
+        ip_address, expires_at = cached
+        if expires_at <= time.monotonic():
+            _start_refresh(host)
+        if ip_address is not None or expires_at > time.monotonic():
+            return ip_address
+    return await asyncio.shield(_start_refresh(host))
+
+
+async def resolve_many(hosts: Iterable[str], limit: int = MAX_CONCURRENT_LOOKUPS) -> Dict[str, Optional[str]]:
+    """Resolves many hostnames concurrently. Returns a host -> IPv4 address (or None) mapping."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def resolve_limited(host):
+        async with semaphore:
+            return await resolve(host)
+
+    hosts = list(dict.fromkeys(hosts))
+    results = await asyncio.gather(*(resolve_limited(host) for host in hosts))
+    return dict(zip(hosts, results))
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+import zlib
+
+import metrics
+import settings
+from database import get_all_servers
+from monitoring import handle_ping_result, log_pool_stats
+from ping import probe_server
+from probe_pool import ProbePool
+from resolver import is_ipv4, resolve_many
+
+logger = logging.getLogger(__name__)
+
+# Random shift of each probe, as a share of the server's interval, so phases don't lock together
+JITTER_FRACTION = 0.02
+
+
+def phase_offset(ip_address: str, interval: float) -> float:
+    """
+    Returns a server's stable phase within its interval, in seconds.
+    It is derived from the IP, so probes of the fleet are spread evenly
+    and a server keeps its slot across restarts and reloads.
+    """
+    return zlib.crc32(ip_address.encode()) / 0xFFFFFFFF * interval
+
+
+class MonitoringScheduler:
+    """
+    Probes every server on its own interval (the server's check_interval, or the
+    global interval from settings). Next-due times are kept in a min-heap and the
+    scheduler only wakes up when the earliest probe is due or a reload is requested.
+    """
+
+    def __init__(self, app):
+        self._app = app
+        self._servers = {}  # ip -> [name, last_status, country_code, probe_type, probe_port, interval]
+        self._anchors = {}  # ip -> jitter-free due time of the server's next probe
+        self._submitted = {}  # ip -> due time of the probe in the pool
+        self._heap = []
+        self._order = itertools.count()
+        self._reload_requested = asyncio.Event()
+        self._pool = ProbePool(self._probe)
+        metrics.probe_queue_depth.set_function(self._pool.queue_size, 'scheduler')
+        self._stats_logged_at = time.monotonic()
+        self._default_interval = None
+
+    def reload(self):
+        """Asks the scheduler to re-read the server list, e.g. after servers or intervals changed."""
+        self._reload_requested.set()
+
+    def _schedule(self, ip_address: str, anchor: float):
+        self._anchors[ip_address] = anchor
+        interval = self._servers[ip_address][5]
+        due = max(anchor + random.uniform(-JITTER_FRACTION, JITTER_FRACTION) * interval, time.monotonic())
+        heapq.heappush(self._heap, (due, next(self._order), ip_address, anchor))
+
+    def _load(self):
+        rows = get_all_servers()
+        default_interval = self._default_interval = settings.get_interval()
+        now = time.monotonic()
+
+        previous = self._servers
+        self._servers = {}
+        for ip, name, last_status, country_code, probe_type, probe_port, check_interval in rows:
+            interval = check_interval or default_interval
+            self._servers[ip] = [name, last_status, country_code, probe_type, probe_port, interval]
+
+            old = previous.get(ip)
+            if old is None or old[5] != interval:
+                self._schedule(ip, now + phase_offset(ip, interval))
+
+        # Heap entries of removed servers are skipped when they come up
+        for ip in previous.keys() - self._servers.keys():
+            self._anchors.pop(ip, None)
+        logger.info(f"Scheduler: Monitoring {len(self._servers)} servers.")
+
+    async def _prefetch_addresses(self):
+        # Hostnames are resolved up front, so probes find their address in the cache
+        hostnames = [address for address in self._servers if not is_ipv4(address)]
+        if hostnames:
+            await resolve_many(hostnames)
+
+    async def _probe(self, ip_address):
+        _, _, _, probe_type, probe_port, _ = self._servers[ip_address]
+        return await probe_server(ip_address, probe_type, probe_port, adaptive=True)
+
+    @staticmethod
+    def _on_status(server, task: asyncio.Task):
+        if task.cancelled():
+            return  # Shutting down
+        status = task.result()
+        # None means the result was left to a confirmation already in progress
+        if status is not None:
+            server[1] = status
+
+    async def _handle_results(self):
+        async for ip, ping_result in self._pool.run():
+            due = self._submitted.pop(ip, None)
+            if due is not None:
+                metrics.check_latency.observe(time.monotonic() - due)
+            server = self._servers.get(ip)
+            if server is None:
+                continue  # Removed while being probed
+
+            if ping_result is not None:
+                name, last_status, country_code, _, _, _ = server
+                task = asyncio.create_task(handle_ping_result(
+                    self._app, self._pool, ip, name, country_code, last_status, ping_result
+                ))
+                task.add_done_callback(lambda t, server=server: self._on_status(server, t))
+
+            previous_anchor = self._anchors.get(ip)
+            if previous_anchor is None:
+                continue  # Dropped from the schedule by a reload while being probed
+
+            # Keep the server's phase, skipping slots missed while the probe was running
+            interval = server[5]
+            anchor = previous_anchor + interval
+            now = time.monotonic()
+            if anchor < now:
+                anchor += (now - anchor) // interval * interval + interval
+            self._schedule(ip, anchor)
+
+            if now - self._stats_logged_at >= self._default_interval:
+                self._stats_logged_at = now
+                log_pool_stats(self._pool.stats(reset=True))
+
+    async def run(self):
+        """Runs the scheduler until cancelled. Raises if handling probe results failed."""
+        self._load()
+        await self._prefetch_addresses()
+        results = asyncio.create_task(self._handle_results())
+        reload_requested = None
+        try:
+            while True:
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    due, _, ip, anchor = heapq.heappop(self._heap)
+                    if self._anchors.get(ip) != anchor:
+                        continue  # Stale entry of a removed or rescheduled server
+                    self._submitted[ip] = due
+                    # Servers that are not known to be UP go first if the pool is saturated
+                    self._pool.submit(ip, priority=0 if self._servers[ip][1] != 'UP' else 1)
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                if reload_requested is None:
+                    reload_requested = asyncio.ensure_future(self._reload_requested.wait())
+                done, _ = await asyncio.wait(
+                    (reload_requested, results), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if results in done:
+                    results.result()  # Re-raises the error that stopped result handling
+                    raise RuntimeError("Probe result handling stopped.")
+                if reload_requested not in done:
+                    continue
+                reload_requested = None
+                self._reload_requested.clear()
+                self._load()
+                await self._prefetch_addresses()
+        finally:
+            results.cancel()
+            if reload_requested is not None:
+                reload_requested.cancel()
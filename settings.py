@@ -12,6 +12,9 @@ INTERVAL_PRESETS = {
 
 DEFAULT_INTERVAL = INTERVAL_PRESETS['frequent']
 
+# Индивидуальные интервалы, которые можно назначить серверу или стране (в секундах)
+SERVER_INTERVAL_PRESETS = [10, 30, 60, 300, 900]
+
 def get_settings():
     """Загружает настройки из файла settings.json."""
     if not os.path.exists(SETTINGS_FILE):
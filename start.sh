@@ -51,6 +51,6 @@ fi
 
 echo "Чтобы остановить бота, выполните ./stop.sh в другом терминале."
 echo "---"
-nohup "$VENV_PYTHON" main.py > bot.log 2>&1 &
+nohup "$VENV_PYTHON" main.py > bot.out 2>&1 &
 echo $! > bot.pid
-echo "Бот запущен в фоновом режиме. Логи пишутся в bot.log"
+echo "Бот запущен в фоновом режиме. Логи пишутся в файл из LOG_FILE (bot.log), вывод процесса - в bot.out"